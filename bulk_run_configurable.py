@@ -1,9 +1,89 @@
 import boto3
 import json
+import math
 import time
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+import sqlite3
+import threading
+import uuid
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Faixas de tamanho de arquivo (limite superior em MB) usadas na recomendação de memória
+SIZE_BUCKETS_MB = [
+    (10, '< 10 MB'),
+    (100, '10-100 MB'),
+    (1024, '100 MB-1 GB'),
+    (None, '>= 1 GB')
+]
+
+# Limites de memória aceitos pela Lambda e folga aplicada sobre o pico observado
+LAMBDA_MEMORY_MIN_MB = 128
+LAMBDA_MEMORY_MAX_MB = 10240
+LAMBDA_MEMORY_STEP_MB = 64
+MEMORY_HEADROOM = 1.3
+
+# Prefixo padrão do índice de conteúdo (hash→chave) mantido pela Lambda
+DEFAULT_DEDUP_INDEX_PREFIX = '_content-index/'
+
+# Status de resultado considerados erro no relatório
+ERROR_STATUSES = ['error', 'partial', 'exception', 'thread_exception']
+
+# Métricas ao vivo: precisão relativa dos percentis e intervalo dos snapshots
+SKETCH_RELATIVE_ACCURACY = 0.01
+METRICS_QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_SNAPSHOT_INTERVAL = 30
+
+# Concorrência automática (max_concurrent='auto'): limites padrão, janela de
+# medição do throughput e fatores de aumento/recuo
+AUTO_CONCURRENCY_MIN = 1
+AUTO_CONCURRENCY_MAX = 32
+AUTO_CONCURRENCY_INITIAL = 2
+AUTO_CONCURRENCY_WINDOW = 30
+AUTO_CONCURRENCY_IMPROVEMENT = 1.05
+AUTO_CONCURRENCY_DEGRADATION = 0.9
+AUTO_CONCURRENCY_THROTTLE_BACKOFF = 0.5
+AUTO_CONCURRENCY_DEGRADATION_BACKOFF = 0.75
+
+# Reenvio especulativo (hedge) de arquivos lentos: multiplicador sobre o p95 do
+# tempo por MB, amostras mínimas, tempo mínimo antes de duplicar, hedges simultâneos,
+# intervalo de verificação e prefixo temporário das cópias duplicadas
+HEDGE_MULTIPLIER = 3.0
+HEDGE_MIN_SAMPLES = 5
+HEDGE_MIN_ELAPSED = 30
+HEDGE_MAX_IN_FLIGHT = 2
+HEDGE_CHECK_INTERVAL = 5
+HEDGE_TEMP_PREFIX = '_hedge/'
+
+# Cache local de metadados das URLs: arquivo padrão, validade das entradas,
+# validade das falhas permanentes (negative cache) e paralelismo da revalidação
+DEFAULT_METADATA_CACHE_FILE = '.lambdownload_cache.sqlite'
+METADATA_CACHE_TTL = 24 * 3600
+NEGATIVE_CACHE_TTL = 7 * 24 * 3600
+PERMANENT_FAILURE_STATUSES = (404, 410)
+REVALIDATE_WORKERS = 16
+
+# Roteamento por região: endpoints S3 regionais na URL de origem e peso da média
+# móvel do throughput observado por função
+S3_REGION_PATTERN = re.compile(r'(?:^|\.)s3[.-](?:dualstack\.)?([a-z]{2}(?:-gov)?-[a-z]+-\d)\.amazonaws\.com$')
+S3_GLOBAL_ENDPOINT_PATTERN = re.compile(r'(?:^|\.)s3(?:-external-1)?\.amazonaws\.com$')
+TARGET_THROUGHPUT_EMA = 0.3
+
+# Erros que indicam throttling da Lambda, timeout ou sobrecarga da origem:
+# exceções/códigos do cliente Lambda, errorType de falhas da função e, no corpo
+# de erro da função, o tipo da exceção HTTP e o status da origem
+LAMBDA_THROTTLE_ERRORS = ('TooManyRequestsException', 'ThrottlingException', 'Throttling',
+                          'ReadTimeoutError', 'ConnectTimeoutError', 'EC2ThrottledException')
+LAMBDA_TIMEOUT_ERROR_TYPES = ('Sandbox.Timedout',)
+LAMBDA_TIMEOUT_MESSAGE = 'Task timed out'
+ORIGIN_TIMEOUT_ERROR_TYPES = ('ReadTimeoutError', 'ConnectTimeoutError')
+ORIGIN_THROTTLE_STATUSES = (429, 503)
 
 
 def check_aws_credentials():
@@ -51,6 +131,46 @@ def test_lambda_function_simple(lambda_client, function_name):
         return False
 
 
+def load_content_index(s3_client, bucket, index_prefix=DEFAULT_DEDUP_INDEX_PREFIX):
+    """
+    Pré-carrega os hashes do índice de conteúdo (apenas listagem, sem ler as entradas).
+    Retorna dict sha256 -> chave da entrada no índice.
+    """
+    index = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{index_prefix}sha256/"):
+        for obj in page.get('Contents', []):
+            name = os.path.basename(obj['Key'])
+            if name.endswith('.json'):
+                index[name[:-len('.json')]] = obj['Key']
+    return index
+
+
+def _is_not_found(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') in ('NoSuchKey', 'NotFound', '404')
+
+
+def lookup_content_index(s3_client, bucket, index, content_sha256, index_prefix=DEFAULT_DEDUP_INDEX_PREFIX):
+    """
+    Resolve um hash para a entrada do índice (bucket, key, size...) do objeto canônico.
+    Hashes fora do índice pré-carregado (ex.: registrados durante o lote) são lidos direto.
+    Retorna None se não houver entrada ou se o objeto canônico não tiver mais esse conteúdo.
+    """
+    index_key = index.get(content_sha256) or f"{index_prefix}sha256/{content_sha256}.json"
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=index_key)
+        entry = json.loads(response['Body'].read())
+        head = s3_client.head_object(Bucket=entry['bucket'], Key=entry['key'])
+    except Exception as e:
+        if not _is_not_found(e):
+            raise
+        return None
+    # Mesma verificação da Lambda: chave sobrescrita ou alterada por delta sync não vale
+    if head.get('Metadata', {}).get('content-sha256') != content_sha256:
+        return None
+    return entry
+
+
 def invoke_lambda_for_file(lambda_client, function_name, file_config, index, total):
     """Invoca a Lambda para um arquivo específico"""
     try:
@@ -68,6 +188,23 @@ def invoke_lambda_for_file(lambda_client, function_name, file_config, index, tot
             payload['bucket'] = file_config['bucket']
         if 'prefix' in file_config:
             payload['prefix'] = file_config['prefix']
+        if file_config.get('profile'):
+            payload['profile'] = True
+        if file_config.get('decode_content'):
+            payload['decode_content'] = True
+        if file_config.get('accept_compressed'):
+            payload['accept_compressed'] = True
+        if file_config.get('delta_sync'):
+            payload['delta_sync'] = True
+        if file_config.get('split'):
+            payload['split'] = file_config['split']
+        if file_config.get('index'):
+            payload['index'] = file_config['index']
+        if file_config.get('destinations'):
+            payload['destinations'] = file_config['destinations']
+        if file_config.get('dedup'):
+            payload['dedup'] = file_config['dedup']
+            payload['dedup_index_prefix'] = file_config.get('dedup_index_prefix', DEFAULT_DEDUP_INDEX_PREFIX)
 
         response = lambda_client.invoke(
             FunctionName=function_name,
@@ -78,16 +215,40 @@ def invoke_lambda_for_file(lambda_client, function_name, file_config, index, tot
         result = json.loads(response['Payload'].read())
         execution_time = time.time() - start_time
 
+        # Falha da própria função (timeout, falta de memória, erro não tratado): sem statusCode
+        if response.get('FunctionError') or not isinstance(result, dict) or 'statusCode' not in result:
+            error = result if isinstance(result, dict) else {}
+            error_type = error.get('errorType') or response.get('FunctionError') or 'Unknown'
+            error_message = error.get('errorMessage', str(result))
+            print(f"[{index}/{total}] ❌ {filename} - Falha na função Lambda ({error_type}): {error_message}")
+            return {'filename': filename, 'status': 'error', 'result': result, 'function_error': True,
+                    'error_type': error_type, 'error': error_message, 'execution_time': execution_time}
+
         if result['statusCode'] == 200:
             body = json.loads(result['body'])
             if body.get('status') == 'skipped':
                 print(f"[{index}/{total}] ⏭️  {filename} - Já existe no S3 ({execution_time:.1f}s)")
                 return {'filename': filename, 'status': 'skipped', 'result': body, 'execution_time': execution_time}
+            elif body.get('status') == 'appended':
+                stats = body.get('stats', {})
+                print(f"[{index}/{total}] ➕ {filename} - {stats.get('size_mb', 0)}MB acrescentados "
+                      f"(objeto: {stats.get('object_size_mb', 0)}MB, total: {execution_time:.1f}s)")
+                return {'filename': filename, 'status': 'success', 'result': body, 'execution_time': execution_time}
+            elif body.get('status') == 'partial':
+                failed = [d['s3_location'] for d in body.get('destinations', []) if d['status'] == 'failed']
+                print(f"[{index}/{total}] ⚠️  {filename} - Falha em {len(failed)} destino(s): {', '.join(failed)}")
+                return {'filename': filename, 'status': 'partial', 'result': body, 'execution_time': execution_time}
+            elif body.get('status') == 'deduplicated':
+                canonical = body.get('dedup', {}).get('canonical_location')
+                print(f"[{index}/{total}] ♻️  {filename} - Conteúdo já existe em {canonical} ({execution_time:.1f}s)")
+                return {'filename': filename, 'status': 'deduplicated', 'result': body,
+                        'execution_time': execution_time}
             else:
                 stats = body.get('stats', {})
                 size_mb = stats.get('size_mb', 0)
                 transfer_time = stats.get('total_time_seconds', 0)
-                print(f"[{index}/{total}] ✅ {filename} - {size_mb}MB em {transfer_time:.1f}s (total: {execution_time:.1f}s)")
+                parts = f" em {stats['parts']} parte(s)" if 'parts' in stats else ''
+                print(f"[{index}/{total}] ✅ {filename} - {size_mb}MB{parts} em {transfer_time:.1f}s (total: {execution_time:.1f}s)")
                 return {'filename': filename, 'status': 'success', 'result': body, 'execution_time': execution_time}
         else:
             print(f"[{index}/{total}] ❌ {filename} - Erro Lambda: {result}")
@@ -96,17 +257,807 @@ def invoke_lambda_for_file(lambda_client, function_name, file_config, index, tot
     except Exception as e:
         execution_time = time.time() - start_time if 'start_time' in locals() else 0
         print(f"[{index}/{total}] 💥 {filename} - Exceção: {str(e)}")
-        return {'filename': filename, 'status': 'exception', 'error': str(e), 'execution_time': execution_time}
+        error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+        return {'filename': filename, 'status': 'exception', 'error': str(e), 'error_type': type(e).__name__,
+                'error_code': error_code, 'execution_time': execution_time}
+
+
+def recommend_memory_by_size(results):
+    """
+    Agrega o profiling retornado pela Lambda por faixa de tamanho de arquivo
+    e recomenda a memória da função para cada faixa (pico observado + folga)
+    """
+    buckets = {}
+    for r in results:
+        if r['status'] != 'success':
+            continue
+        stats = r.get('result', {}).get('stats', {})
+        profile = stats.get('profile')
+        if not profile:
+            continue
+
+        size_mb = stats.get('size_mb', 0)
+        label = next(label for limit, label in SIZE_BUCKETS_MB if limit is None or size_mb < limit)
+        bucket = buckets.setdefault(label, {
+            'files': 0,
+            'max_size_mb': 0,
+            'max_peak_rss_mb': 0,
+            'cpu_seconds': {},
+            'configured_memory_mb': profile.get('memory_limit_mb')
+        })
+        bucket['files'] += 1
+        bucket['max_size_mb'] = max(bucket['max_size_mb'], size_mb)
+        bucket['max_peak_rss_mb'] = max(bucket['max_peak_rss_mb'], profile.get('peak_rss_mb', 0))
+        for phase, seconds in profile.get('cpu_seconds', {}).items():
+            bucket['cpu_seconds'][phase] = round(bucket['cpu_seconds'].get(phase, 0) + seconds, 3)
+
+    recommendations = []
+    for _, label in SIZE_BUCKETS_MB:
+        if label not in buckets:
+            continue
+        bucket = buckets[label]
+        steps = math.ceil(bucket['max_peak_rss_mb'] * MEMORY_HEADROOM / LAMBDA_MEMORY_STEP_MB)
+        recommended = min(LAMBDA_MEMORY_MAX_MB, max(LAMBDA_MEMORY_MIN_MB, steps * LAMBDA_MEMORY_STEP_MB))
+        recommendations.append({
+            'size_bucket': label,
+            'recommended_memory_mb': recommended,
+            **bucket
+        })
+
+    return recommendations
+
+
+class QuantileSketch:
+    """
+    Sketch de percentis com erro relativo limitado (buckets logarítmicos, estilo DDSketch).
+    Memória proporcional ao intervalo dos valores, não à quantidade de amostras.
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def quantile(self, q):
+        """Valor aproximado do percentil q (0-1); None se não houver amostras"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class BatchStats:
+    """
+    Estatísticas agregadas do lote, atualizadas a cada resultado (thread-safe):
+    contagem por status, MB transferidos, percentis de tempo de execução e
+    throughput, e histograma de classes de erro.
+    """
+
+    def __init__(self, total_files):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.total_files = total_files
+        self.in_flight = 0
+        self.counts = {}
+        self.mb_by_status = {}
+        self.error_classes = {}
+        self.execution_time = QuantileSketch()
+        self.throughput = QuantileSketch()
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def add(self, result):
+        status = result['status']
+        size_mb = 0
+        if isinstance(result.get('result'), dict):
+            size_mb = result['result'].get('stats', {}).get('size_mb', 0) or 0
+        execution_time = result.get('execution_time', 0)
+
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.counts[status] = self.counts.get(status, 0) + 1
+            self.mb_by_status[status] = self.mb_by_status.get(status, 0) + size_mb
+            if status in ERROR_STATUSES:
+                error_class = _error_class(result)
+                self.error_classes[error_class] = self.error_classes.get(error_class, 0) + 1
+            elif status != 'skipped' and not result.get('cached'):
+                # Apenas invocações que transferiram algo entram nos percentis
+                self.execution_time.add(execution_time)
+                if status == 'success' and execution_time > 0:
+                    self.throughput.add(size_mb / execution_time)
+
+    def snapshot(self):
+        """Estado atual em um dict serializável"""
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            completed = sum(self.counts.values())
+            transferred_mb = self.mb_by_status.get('success', 0)
+            return {
+                'timestamp': datetime.now().isoformat(),
+                'elapsed_seconds': round(elapsed, 1),
+                'total_files': self.total_files,
+                'completed': completed,
+                'in_flight': self.in_flight,
+                'counts': dict(self.counts),
+                'errors': sum(self.counts.get(status, 0) for status in ERROR_STATUSES),
+                'transferred_mb': round(transferred_mb, 2),
+                'mb_by_status': {status: round(mb, 2) for status, mb in self.mb_by_status.items()},
+                'aggregate_speed_mbps': round(transferred_mb / elapsed, 2) if elapsed > 0 else 0,
+                'execution_time_seconds': {f"p{int(q * 100)}": _round_or_none(self.execution_time.quantile(q))
+                                           for q in METRICS_QUANTILES},
+                'throughput_mbps': {f"p{int(q * 100)}": _round_or_none(self.throughput.quantile(q))
+                                    for q in METRICS_QUANTILES},
+                'error_classes': dict(self.error_classes)
+            }
+
+    def to_prometheus(self):
+        """Snapshot no formato texto do Prometheus"""
+        snap = self.snapshot()
+        lines = [
+            '# TYPE lambdownload_files_total counter',
+            *[f'lambdownload_files_total{{status="{status}"}} {count}' for status, count in snap['counts'].items()],
+            '# TYPE lambdownload_files_planned gauge',
+            f"lambdownload_files_planned {snap['total_files']}",
+            '# TYPE lambdownload_in_flight gauge',
+            f"lambdownload_in_flight {snap['in_flight']}",
+            '# TYPE lambdownload_transferred_megabytes_total counter',
+            f"lambdownload_transferred_megabytes_total {snap['transferred_mb']}",
+            '# TYPE lambdownload_elapsed_seconds gauge',
+            f"lambdownload_elapsed_seconds {snap['elapsed_seconds']}",
+            '# TYPE lambdownload_execution_seconds summary',
+            *[f'lambdownload_execution_seconds{{quantile="{q}"}} '
+              f"{snap['execution_time_seconds'][f'p{int(q * 100)}'] or 0}" for q in METRICS_QUANTILES],
+            '# TYPE lambdownload_throughput_mbps summary',
+            *[f'lambdownload_throughput_mbps{{quantile="{q}"}} '
+              f"{snap['throughput_mbps'][f'p{int(q * 100)}'] or 0}" for q in METRICS_QUANTILES],
+            '# TYPE lambdownload_errors_total counter',
+            *[f'lambdownload_errors_total{{class="{_prometheus_label(error_class)}"}} {count}'
+              for error_class, count in snap['error_classes'].items()]
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+def _round_or_none(value, digits=2):
+    return round(value, digits) if value is not None else None
+
+
+def _prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _error_class(result):
+    """Classe do erro de um resultado, para o histograma de erros"""
+    status = result['status']
+    if status == 'exception':
+        return result.get('error_type', 'Exception')
+    if status == 'error' and result.get('function_error'):
+        return f"lambda_function: {result['error_type']}"
+    if status == 'error' and isinstance(result.get('result'), dict):
+        lambda_result = result['result']
+        try:
+            message = json.loads(lambda_result.get('body', '{}')).get('message')
+        except (TypeError, ValueError):
+            message = None
+        return f"lambda_{lambda_result.get('statusCode', 'unknown')}: {message or lambda_result.get('errorType', 'erro')}"
+    return status
+
+
+def error_body(result):
+    """Corpo JSON da resposta de erro do handler (dict vazio se não houver)"""
+    lambda_result = result.get('result')
+    if not isinstance(lambda_result, dict):
+        return {}
+    try:
+        body = json.loads(lambda_result.get('body') or '{}')
+    except (TypeError, ValueError):
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def is_throttle_result(result):
+    """Indica se o resultado foi throttling da Lambda, timeout ou 429/503 da origem"""
+    status = result['status']
+    if status == 'exception':
+        return (result.get('error_type') in LAMBDA_THROTTLE_ERRORS or
+                result.get('error_code') in LAMBDA_THROTTLE_ERRORS)
+    if status != 'error':
+        return False
+    if result.get('function_error'):
+        return (result.get('error_type') in LAMBDA_TIMEOUT_ERROR_TYPES or
+                LAMBDA_TIMEOUT_MESSAGE in (result.get('error') or ''))
+    body = error_body(result)
+    return (body.get('http_status') in ORIGIN_THROTTLE_STATUSES or
+            body.get('error_type') in ORIGIN_TIMEOUT_ERROR_TYPES)
+
+
+class ConcurrencyController:
+    """
+    Controla quantas invocações ficam em andamento ao mesmo tempo (AIMD).
+
+    A cada janela de medição, aumenta o limite em 1 enquanto o throughput
+    agregado melhora, mantém quando estabiliza e recua multiplicativamente
+    em throttling/timeouts ou queda de throughput, dentro de [minimum, maximum].
+    """
+
+    def __init__(self, initial=AUTO_CONCURRENCY_INITIAL, minimum=AUTO_CONCURRENCY_MIN,
+                 maximum=AUTO_CONCURRENCY_MAX, window_seconds=AUTO_CONCURRENCY_WINDOW):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(maximum, initial))
+        self.window_seconds = window_seconds
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.previous_throughput = None
+        self.best = {'limit': self.limit, 'throughput_mbps': 0}
+        self.history = []
+        self.last_backoff = 0
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_start = time.time()
+        self.window_mb = 0
+        self.window_completed = 0
+        self.window_throttles = 0
+
+    def acquire(self):
+        """Bloqueia até haver vaga dentro do limite atual"""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, result):
+        """Libera a vaga e registra o resultado na janela de medição"""
+        with self.condition:
+            self.in_flight -= 1
+            self.window_completed += 1
+            if result and result['status'] == 'success':
+                self.window_mb += result['result'].get('stats', {}).get('size_mb', 0) or 0
+            if result and is_throttle_result(result):
+                self.window_throttles += 1
+
+            # Throttling reage logo (no máximo um recuo a cada 1/3 de janela); o restante só ao fim da janela
+            now = time.time()
+            throttle_backoff = self.window_throttles and now - self.last_backoff >= self.window_seconds / 3
+            if throttle_backoff or now - self.window_start >= self.window_seconds:
+                self._adjust()
+            self.condition.notify_all()
+
+    def _adjust(self):
+        elapsed = max(time.time() - self.window_start, 1e-6)
+        throughput = self.window_mb / elapsed
+        previous_limit = self.limit
+
+        if self.window_throttles:
+            self.limit = max(self.minimum, int(self.limit * AUTO_CONCURRENCY_THROTTLE_BACKOFF))
+            self.last_backoff = time.time()
+            reason = f"{self.window_throttles} throttling/timeout"
+        elif self.window_mb == 0:
+            # Janela sem transferências (ex.: apenas arquivos ignorados): sem dados para decidir
+            reason = 'sem transferências na janela'
+        elif (self.previous_throughput is not None and
+              throughput < self.previous_throughput * AUTO_CONCURRENCY_DEGRADATION):
+            self.limit = max(self.minimum, int(self.limit * AUTO_CONCURRENCY_DEGRADATION_BACKOFF))
+            reason = 'queda de throughput'
+        elif self.previous_throughput is None or throughput > self.previous_throughput * AUTO_CONCURRENCY_IMPROVEMENT:
+            self.limit = min(self.maximum, self.limit + 1)
+            reason = 'throughput melhorou'
+        else:
+            reason = 'throughput estável'
+
+        if not self.window_throttles and self.window_mb > 0 and throughput > self.best['throughput_mbps']:
+            self.best = {'limit': previous_limit, 'throughput_mbps': round(throughput, 2)}
+
+        if self.limit < previous_limit:
+            # Após recuar, a próxima janela vira a nova referência (e volta a sondar para cima)
+            self.previous_throughput = None
+        elif self.window_mb > 0:
+            self.previous_throughput = throughput
+
+        self.history.append({
+            'elapsed_seconds': round(elapsed, 1),
+            'limit': previous_limit,
+            'throughput_mbps': round(throughput, 2),
+            'throttles': self.window_throttles,
+            'new_limit': self.limit
+        })
+        if self.limit != previous_limit:
+            print(f"🎚️ Concorrência: {previous_limit} -> {self.limit} ({reason}, {throughput:.1f} MB/s)")
+        self._reset_window()
+
+    def summary(self):
+        with self.condition:
+            return {
+                'final_limit': self.limit,
+                'best_limit': self.best['limit'],
+                'best_throughput_mbps': self.best['throughput_mbps'],
+                'minimum': self.minimum,
+                'maximum': self.maximum,
+                'history': list(self.history)
+            }
+
+
+def build_s3_key(prefix, filename):
+    """Mesma regra de chave da Lambda: prefixo (com ou sem '/') + nome do arquivo"""
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    return f"{prefix}{filename}" if prefix else filename
+
+
+def destination_location(file_config):
+    """Local S3 de destino do arquivo (s3://bucket/chave)"""
+    return f"s3://{file_config['bucket']}/{build_s3_key(file_config['prefix'], file_config['filename'])}"
+
+
+def probe_url(url, timeout=10):
+    """
+    Consulta a origem via HEAD. Retorna dict com status, size, etag e last_modified;
+    status None indica falha de rede (não deve ser cacheada).
+    """
+    request = urllib.request.Request(url, method='HEAD',
+                                     headers={'User-Agent': 'AWS-Lambda-HTTPS-Downloader/1.0'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            content_length = response.headers.get('content-length')
+            return {
+                'status': response.status,
+                'size': int(content_length) if content_length else None,
+                'etag': response.headers.get('etag'),
+                'last_modified': response.headers.get('last-modified')
+            }
+    except urllib.error.HTTPError as e:
+        return {'status': e.code, 'size': None, 'etag': None, 'last_modified': None}
+    except Exception:
+        return {'status': None, 'size': None, 'etag': None, 'last_modified': None}
+
+
+def probe_content_length(url, timeout=10):
+    """Tamanho do arquivo na origem via HEAD (None se indisponível)"""
+    return probe_url(url, timeout)['size']
+
+
+class MetadataCache:
+    """
+    Cache local (SQLite) dos metadados das URLs entre execuções: status HTTP,
+    tamanho, ETag, Last-Modified, data da consulta e último destino gravado.
+    Entradas valem por ttl segundos; falhas permanentes (404/410) por negative_ttl.
+    """
+
+    def __init__(self, path=DEFAULT_METADATA_CACHE_FILE, ttl=METADATA_CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS url_metadata (
+                    url TEXT PRIMARY KEY,
+                    status INTEGER,
+                    size INTEGER,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked_at REAL,
+                    completed_location TEXT,
+                    completed_size INTEGER,
+                    completed_at REAL,
+                    completed_destination TEXT
+                )
+            """)
+            try:
+                # Caches criados antes da coluna completed_destination
+                self.connection.execute("ALTER TABLE url_metadata ADD COLUMN completed_destination TEXT")
+            except sqlite3.OperationalError:
+                pass
+
+    def get_many(self, urls):
+        """Entradas em cache para as URLs (dict url -> entrada)"""
+        entries = {}
+        urls = list(urls)
+        with self.lock:
+            # Consulta em lotes para respeitar o limite de parâmetros do SQLite
+            for i in range(0, len(urls), 500):
+                batch = urls[i:i + 500]
+                cursor = self.connection.execute(
+                    f"SELECT * FROM url_metadata WHERE url IN ({','.join('?' * len(batch))})", batch)
+                columns = [column[0] for column in cursor.description]
+                for row in cursor:
+                    entry = dict(zip(columns, row))
+                    entries[entry['url']] = entry
+        return entries
+
+    def is_fresh(self, entry, now=None):
+        if not entry or entry['checked_at'] is None or entry['status'] is None:
+            return False
+        now = now or time.time()
+        ttl = self.negative_ttl if entry['status'] in PERMANENT_FAILURE_STATUSES else self.ttl
+        return now - entry['checked_at'] < ttl
 
+    def put(self, url, probe):
+        """Grava o resultado de uma consulta à origem (falhas de rede não são gravadas)"""
+        if probe['status'] is None:
+            return
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO url_metadata (url, status, size, etag, last_modified, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET status = excluded.status, size = excluded.size,
+                    etag = excluded.etag, last_modified = excluded.last_modified, checked_at = excluded.checked_at
+            """, (url, probe['status'], probe['size'], probe['etag'], probe['last_modified'], time.time()))
 
-def save_results_to_file(results, filename="batch_results.json"):
+    def put_many(self, probes):
+        for url, probe in probes.items():
+            self.put(url, probe)
+
+    def mark_completed(self, url, location, size, destination=None):
+        """
+        Registra que a URL (com o tamanho informado) já está gravada em location
+        para o destino destination (padrão: o próprio location; difere quando o
+        conteúdo deduplicado ficou apenas no objeto canônico)
+        """
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO url_metadata (url, completed_location, completed_size, completed_at, completed_destination)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET completed_location = excluded.completed_location,
+                    completed_size = excluded.completed_size, completed_at = excluded.completed_at,
+                    completed_destination = excluded.completed_destination
+            """, (url, location, size, time.time(), destination or location))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def plan_with_cache(cache, files_to_download, workers=REVALIDATE_WORKERS, allow_completed_skip=True):
+    """
+    Planeja o lote a partir do cache local antes de qualquer invocação:
+    revalida em paralelo apenas as URLs sem entrada válida, resolve sem invocar
+    a Lambda as falhas permanentes e os arquivos já gravados sem mudança de tamanho,
+    e ordena o restante do maior para o menor (os grandes não ficam para o fim).
+
+    Retorna (arquivos a processar, resultados resolvidos pelo cache).
+    """
+    urls = [file_config['url'] for file_config in files_to_download]
+    entries = cache.get_many(urls)
+    now = time.time()
+    stale = [url for url in urls if not cache.is_fresh(entries.get(url), now)]
+
+    if stale:
+        print(f"🗄️ Revalidando {len(stale)} URL(s) fora do cache ({len(urls) - len(stale)} em cache)...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            probes = dict(zip(stale, executor.map(probe_url, stale)))
+        cache.put_many(probes)
+        entries = cache.get_many(urls)
+    else:
+        print(f"🗄️ Todas as {len(urls)} URL(s) resolvidas pelo cache local")
+
+    to_process = []
+    resolved = []
+    for file_config in files_to_download:
+        entry = entries.get(file_config['url']) or {}
+        expected_location = destination_location(file_config)
+        completed_destination = entry.get('completed_destination') or entry.get('completed_location')
+
+        if entry.get('status') in PERMANENT_FAILURE_STATUSES:
+            resolved.append({
+                'filename': file_config['filename'],
+                'status': 'error',
+                'error': f"HTTP {entry['status']} na origem (cache local)",
+                'cached': True,
+                'execution_time': 0
+            })
+        elif (allow_completed_skip and completed_destination == expected_location and
+              entry.get('size') is not None and entry.get('completed_size') == entry.get('size')):
+            resolved.append({
+                'filename': file_config['filename'],
+                'status': 'skipped',
+                'result': {'message': 'Já transferido (cache local)', 's3_location': entry['completed_location']},
+                'cached': True,
+                'execution_time': 0
+            })
+        else:
+            to_process.append((file_config, entry.get('size')))
+
+    to_process.sort(key=lambda item: -(item[1] or 0))
+    return [file_config for file_config, _ in to_process], resolved
+
+
+class StragglerHedger:
+    """
+    Detecta arquivos lentos (stragglers) e coordena invocações duplicadas (hedges).
+
+    Um arquivo em andamento vira straggler quando seu tempo decorrido passa de
+    multiplier × p95 do tempo por MB já observado × seu tamanho. O hedge grava
+    em uma chave temporária; a primeira tentativa concluída com sucesso vence
+    (claim), a do hedge é copiada para a chave final e a temporária é removida.
+    """
+
+    def __init__(self, multiplier=HEDGE_MULTIPLIER, min_samples=HEDGE_MIN_SAMPLES,
+                 min_elapsed=HEDGE_MIN_ELAPSED, max_in_flight=HEDGE_MAX_IN_FLIGHT):
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.min_elapsed = min_elapsed
+        self.max_in_flight = max_in_flight
+        self.lock = threading.Lock()
+        self.seconds_per_mb = QuantileSketch()
+        self.execution_time = QuantileSketch()
+        self.started = {}
+        self.sizes_mb = {}
+        self.hedges = {}
+        self.settled = {}
+        self.deferred = {}
+        self.launched = 0
+        self.won = 0
+
+    def record_start(self, url):
+        with self.lock:
+            self.started[url] = time.time()
+
+    def record_result(self, result):
+        """Alimenta a distribuição de latência com um resultado bem-sucedido"""
+        if result['status'] != 'success' or not result.get('execution_time'):
+            return
+        size_mb = result['result'].get('stats', {}).get('size_mb', 0) or 0
+        self.execution_time.add(result['execution_time'])
+        self.seconds_per_mb.add(result['execution_time'] / max(size_mb, 1))
+
+    def claim(self, url, winner):
+        """Marca a tentativa vencedora de um arquivo; False se outra já venceu"""
+        with self.lock:
+            if url in self.settled:
+                return False
+            self.settled[url] = winner
+            self.started.pop(url, None)
+            if winner == 'hedge':
+                self.won += 1
+            return True
+
+    def is_settled(self, url):
+        with self.lock:
+            return url in self.settled
+
+    def hedge_running(self, url):
+        with self.lock:
+            return self.hedges.get(url) == 'running'
+
+    def hedge_finished(self, url):
+        with self.lock:
+            self.hedges[url] = 'done'
+
+    def stragglers(self):
+        """URLs em andamento que devem receber um hedge agora"""
+        if self.seconds_per_mb.count < self.min_samples:
+            return []
+
+        now = time.time()
+        p95_per_mb = self.seconds_per_mb.quantile(0.95)
+        p95_execution = self.execution_time.quantile(0.95)
+        with self.lock:
+            running = len([state for state in self.hedges.values() if state == 'running'])
+            candidates = [(url, now - start) for url, start in self.started.items()
+                          if url not in self.hedges and url not in self.settled]
+
+        selected = []
+        for url, elapsed in sorted(candidates, key=lambda item: -item[1]):
+            if running + len(selected) >= self.max_in_flight:
+                break
+            # Filtro barato antes de consultar o tamanho na origem
+            if elapsed < self.min_elapsed or elapsed < self.multiplier * p95_per_mb:
+                continue
+            if url not in self.sizes_mb:
+                size = probe_content_length(url)
+                self.sizes_mb[url] = size / (1024 * 1024) if size else None
+            size_mb = self.sizes_mb[url]
+            threshold = (self.multiplier * p95_per_mb * max(size_mb, 1) if size_mb is not None
+                         else self.multiplier * p95_execution)
+            if elapsed >= threshold:
+                selected.append(url)
+
+        with self.lock:
+            for url in selected:
+                self.hedges[url] = 'running'
+                self.launched += 1
+        return selected
+
+    def summary(self):
+        with self.lock:
+            return {'launched': self.launched, 'won': self.won}
+
+
+def update_cache_from_result(cache, url, result, destination=None):
+    """
+    Atualiza o cache com o resultado de uma invocação: destino gravado (inclusive
+    conteúdo deduplicado, cujo s3_location no modo skip é o objeto canônico) ou
+    falha permanente informada pelo http_status do corpo de erro do handler.
+    """
+    if result['status'] in ('success', 'skipped', 'deduplicated'):
+        entry = cache.get_many([url]).get(url) or {}
+        location = result.get('result', {}).get('s3_location')
+        if location and entry.get('size') is not None:
+            cache.mark_completed(url, location, entry['size'], destination)
+    elif result['status'] == 'error':
+        status = error_body(result).get('http_status')
+        if status in PERMANENT_FAILURE_STATUSES:
+            cache.put(url, {'status': status, 'size': None, 'etag': None, 'last_modified': None})
+
+
+def source_region(url, source_regions=None):
+    """
+    Região AWS da origem: pelo mapa source_regions (sufixo de host -> região)
+    ou pelo endpoint S3 da URL. None se não for possível identificar.
+    """
+    host = (urlparse(url).hostname or '').lower()
+    for suffix, region in (source_regions or {}).items():
+        if host == suffix or host.endswith(f".{suffix}"):
+            return region
+    match = S3_REGION_PATTERN.search(host)
+    if match:
+        return match.group(1)
+    if S3_GLOBAL_ENDPOINT_PATTERN.search(host):
+        return 'us-east-1'
+    return None
+
+
+class TargetRouter:
+    """
+    Distribui as invocações entre funções Lambda em várias regiões.
+
+    Cada URL vai para as funções da região da origem (ou, na falta, da mesma
+    geografia, ex.: 'sa', 'us'); entre as candidatas escolhe a de menor
+    (em andamento + 1) / throughput observado. Um cliente Lambda por região
+    é criado uma única vez e reaproveitado.
+    """
+
+    def __init__(self, targets, source_regions=None):
+        self.lock = threading.Lock()
+        self.source_regions = source_regions or {}
+        clients = {}
+        self.targets = []
+        for target in targets:
+            region = target.get('region')
+            if region not in clients:
+                clients[region] = boto3.client('lambda', region_name=region) if region else boto3.client('lambda')
+            self.targets.append({
+                'function_name': target['function_name'],
+                'region': region or clients[region].meta.region_name,
+                'client': clients[region],
+                'in_flight': 0,
+                'completed': 0,
+                'transferred_mb': 0,
+                'throughput_mbps': None
+            })
+
+    def remove(self, target):
+        with self.lock:
+            self.targets.remove(target)
+
+    def candidates(self, url):
+        region = source_region(url, self.source_regions)
+        if region:
+            same_region = [t for t in self.targets if t['region'] == region]
+            if same_region:
+                return same_region
+            geography = region.split('-')[0]
+            same_geography = [t for t in self.targets if t['region'].split('-')[0] == geography]
+            if same_geography:
+                return same_geography
+        return self.targets
+
+    def acquire(self, url):
+        """Escolhe a função para a URL e a marca como em andamento"""
+        with self.lock:
+            candidates = self.candidates(url)
+            known = [t['throughput_mbps'] for t in candidates if t['throughput_mbps']]
+            default_throughput = sum(known) / len(known) if known else 1
+            target = min(candidates, key=lambda t: (t['in_flight'] + 1) / (t['throughput_mbps'] or default_throughput))
+            target['in_flight'] += 1
+            return target
+
+    def release(self, target, result):
+        with self.lock:
+            target['in_flight'] -= 1
+            target['completed'] += 1
+            if result and result['status'] == 'success' and result.get('execution_time'):
+                size_mb = result['result'].get('stats', {}).get('size_mb', 0) or 0
+                target['transferred_mb'] += size_mb
+                throughput = size_mb / result['execution_time']
+                if target['throughput_mbps'] is None:
+                    target['throughput_mbps'] = throughput
+                else:
+                    target['throughput_mbps'] += TARGET_THROUGHPUT_EMA * (throughput - target['throughput_mbps'])
+
+    def invoke(self, file_config, index, total):
+        """Invoca a função escolhida para o arquivo e registra o resultado"""
+        target = self.acquire(file_config['url'])
+        result = None
+        try:
+            result = invoke_lambda_for_file(target['client'], target['function_name'], file_config, index, total)
+            result['target'] = f"{target['region']}:{target['function_name']}"
+            return result
+        finally:
+            self.release(target, result)
+
+    def summary(self):
+        with self.lock:
+            return [{
+                'function_name': t['function_name'],
+                'region': t['region'],
+                'completed': t['completed'],
+                'transferred_mb': round(t['transferred_mb'], 2),
+                'throughput_mbps': round(t['throughput_mbps'], 2) if t['throughput_mbps'] else None
+            } for t in self.targets]
+
+
+def start_metrics_server(stats, port):
+    """Serve as métricas do lote em http://localhost:<port>/metrics (formato Prometheus)"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = stats.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_snapshot_writer(stats, filename, interval, stop_event):
+    """Acrescenta um snapshot JSON por linha em filename a cada interval segundos"""
+
+    def _write():
+        with open(filename, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(stats.snapshot(), ensure_ascii=False) + '\n')
+
+    def _loop():
+        while not stop_event.wait(interval):
+            _write()
+        _write()
+
+    thread = threading.Thread(target=_loop, daemon=True)
+    thread.start()
+    return thread
+
+
+def save_results_to_file(results, filename="batch_results.json", summary=None):
     """Salva resultados em arquivo JSON"""
     try:
+        data = {
+            'timestamp': datetime.now().isoformat(),
+            'results': results
+        }
+        if summary:
+            data['summary'] = summary
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({
-                'timestamp': datetime.now().isoformat(),
-                'results': results
-            }, f, indent=2, ensure_ascii=False)
+            json.dump(data, f, indent=2, ensure_ascii=False)
         print(f"💾 Resultados salvos em: {filename}")
     except Exception as e:
         print(f"❌ Erro ao salvar resultados: {str(e)}")
@@ -115,12 +1066,43 @@ def save_results_to_file(results, filename="batch_results.json"):
 def process_files_with_config(config):
     """Processa lista de arquivos usando configuração fornecida"""
     
-    function_name = config['function_name']
+    function_name = config.get('function_name')
+    targets = config.get('targets') or [{'function_name': function_name, 'region': config.get('region')}]
     max_concurrent = config.get('max_concurrent', 2)
+    controller = None
+    if max_concurrent == 'auto':
+        controller = ConcurrencyController(
+            initial=config.get('concurrency_initial', AUTO_CONCURRENCY_INITIAL),
+            minimum=config.get('concurrency_min', AUTO_CONCURRENCY_MIN),
+            maximum=config.get('concurrency_max', AUTO_CONCURRENCY_MAX),
+            window_seconds=config.get('concurrency_window', AUTO_CONCURRENCY_WINDOW)
+        )
+        max_concurrent = controller.maximum
     base_url = config['base_url']
     bucket_name = config['bucket']
     s3_prefix = config.get('prefix', '')
     filenames = config['files']
+    profile = config.get('profile', False)
+    dedup = config.get('dedup')
+    destinations = config.get('destinations')
+    decode_content = config.get('decode_content', False)
+    accept_compressed = config.get('accept_compressed', False)
+    delta_sync = config.get('delta_sync', False)
+    split = config.get('split')
+    index = config.get('index')
+    dedup_index_prefix = config.get('dedup_index_prefix', DEFAULT_DEDUP_INDEX_PREFIX)
+    hedge = config.get('hedge')
+    metadata_cache = config.get('metadata_cache')
+    metrics_port = config.get('metrics_port')
+    metrics_snapshot_file = config.get('metrics_snapshot_file')
+    metrics_snapshot_interval = config.get('metrics_snapshot_interval', DEFAULT_SNAPSHOT_INTERVAL)
+
+    # A mesma lista de destinos vai para todos os arquivos: chave/nome fixos gravariam
+    # todos os arquivos no mesmo objeto
+    if destinations and any('key' in dest or 'filename' in dest for dest in destinations):
+        print("❌ Em lote, 'destinations' aceita apenas bucket, prefix, encryption e kms_key_id "
+              "(o nome de cada arquivo é usado como chave)")
+        return
 
     # Construir lista de configurações de arquivos
     files_to_download = []
@@ -129,72 +1111,272 @@ def process_files_with_config(config):
             'filename': filename,
             'url': f"{base_url}{filename}",
             'bucket': bucket_name,
-            'prefix': s3_prefix
+            'prefix': s3_prefix,
+            'profile': profile,
+            'destinations': destinations,
+            'decode_content': decode_content,
+            'accept_compressed': accept_compressed,
+            'delta_sync': delta_sync,
+            'split': split,
+            'index': index,
+            'dedup': dedup,
+            'dedup_index_prefix': dedup_index_prefix
         })
 
     print(f"🚀 Iniciando processamento em lote")
     print(f"📝 Configurações:")
-    print(f"   - Função Lambda: {function_name}")
+    for target in targets:
+        print(f"   - Função Lambda: {target['function_name']} ({target.get('region') or 'região padrão'})")
     print(f"   - Bucket S3: {bucket_name}")
     print(f"   - Prefixo S3: {s3_prefix}")
+    if destinations:
+        print(f"   - Destinos por arquivo: {len(destinations)} (bucket/prefixo principal só se listado)")
     print(f"   - URL base: {base_url}")
     print(f"   - Total de arquivos: {len(files_to_download)}")
-    print(f"   - Execuções simultâneas: {max_concurrent}")
+    if controller:
+        print(f"   - Execuções simultâneas: automático ({controller.minimum}-{controller.maximum}, "
+              f"início {controller.limit})")
+    else:
+        print(f"   - Execuções simultâneas: {max_concurrent}")
+    print(f"   - Profiling de memória/CPU: {'sim' if profile else 'não'}")
+    print(f"   - Deduplicação por conteúdo: {dedup or 'desligada'}")
     print()
 
     # Verificar credenciais AWS
     if not check_aws_credentials():
         return
 
-    # Inicializar cliente Lambda
+    # Inicializar clientes Lambda (um por região)
     try:
-        lambda_client = boto3.client('lambda')
+        router = TargetRouter(targets, config.get('source_regions'))
         print(f"✅ Cliente Lambda inicializado")
     except Exception as e:
         print(f"❌ Erro ao inicializar cliente Lambda: {str(e)}")
         return
 
-    # Testar função Lambda
-    if not test_lambda_function_simple(lambda_client, function_name):
+    # Testar funções Lambda
+    for target in list(router.targets):
+        if not test_lambda_function_simple(target['client'], target['function_name']):
+            router.remove(target)
+    if not router.targets:
         print(f"❌ Abortando execução devido a problemas com a função Lambda")
         return
 
+    # Pré-carregar índice de conteúdo
+    content_index = {}
+    dedup_s3_client = None
+    if dedup:
+        try:
+            dedup_s3_client = boto3.client('s3')
+            content_index = load_content_index(dedup_s3_client, bucket_name, dedup_index_prefix)
+            print(f"♻️ Índice de conteúdo carregado: {len(content_index)} hash(es) em "
+                  f"s3://{bucket_name}/{dedup_index_prefix}")
+        except Exception as e:
+            print(f"⚠️ Não foi possível carregar o índice de conteúdo: {str(e)}")
+
     print()
     print(f"📈 Iniciando processamento de {len(files_to_download)} arquivos...")
     print()
 
+    # Cache local de metadados: planejamento sem sondar a origem a cada execução
+    cache = None
+    resolved_results = []
+    if metadata_cache:
+        cache = MetadataCache(
+            metadata_cache if isinstance(metadata_cache, str) else DEFAULT_METADATA_CACHE_FILE,
+            ttl=config.get('metadata_cache_ttl', METADATA_CACHE_TTL),
+            negative_ttl=config.get('negative_cache_ttl', NEGATIVE_CACHE_TTL)
+        )
+        planned_total = len(files_to_download)
+        files_to_download, resolved_results = plan_with_cache(
+            cache, files_to_download,
+            workers=config.get('revalidate_workers', REVALIDATE_WORKERS),
+            allow_completed_skip=not delta_sync
+        )
+        print(f"🗄️ Plano: {len(files_to_download)} de {planned_total} arquivo(s) a processar "
+              f"({len(resolved_results)} resolvido(s) pelo cache)")
+        print()
+
+    # Hedge de stragglers (apenas para o modo simples: um objeto por arquivo)
+    hedger = None
+    s3_client = None
+    if hedge:
+        if dedup or destinations or delta_sync or split or index:
+            print("⚠️ Hedge desativado: não suportado com dedup, destinations, delta_sync, split ou index")
+        else:
+            hedge_config = hedge if isinstance(hedge, dict) else {}
+            hedger = StragglerHedger(
+                multiplier=hedge_config.get('multiplier', HEDGE_MULTIPLIER),
+                min_samples=hedge_config.get('min_samples', HEDGE_MIN_SAMPLES),
+                min_elapsed=hedge_config.get('min_elapsed', HEDGE_MIN_ELAPSED),
+                max_in_flight=hedge_config.get('max_in_flight', HEDGE_MAX_IN_FLIGHT)
+            )
+            s3_client = boto3.client('s3')
+            print(f"🐇 Hedge de stragglers ativo (>{hedger.multiplier}x p95 do tempo por MB)")
+
+    # Estatísticas ao vivo (endpoint Prometheus e snapshots periódicos opcionais)
+    stats = BatchStats(len(files_to_download) + len(resolved_results))
+    metrics_server = None
+    if metrics_port:
+        metrics_server = start_metrics_server(stats, metrics_port)
+        print(f"📡 Métricas em http://127.0.0.1:{metrics_port}/metrics")
+    stop_snapshots = threading.Event()
+    snapshot_thread = None
+    if metrics_snapshot_file:
+        snapshot_thread = start_snapshot_writer(stats, metrics_snapshot_file, metrics_snapshot_interval,
+                                                stop_snapshots)
+        print(f"📸 Snapshots a cada {metrics_snapshot_interval}s em: {metrics_snapshot_file}")
+
+    def run_file(file_config, index):
+        if controller:
+            controller.acquire()
+        stats.started()
+        if hedger:
+            hedger.record_start(file_config['url'])
+        result = None
+        try:
+            result = router.invoke(file_config, index, len(files_to_download))
+            return result
+        finally:
+            if controller:
+                controller.release(result)
+
+    def run_hedge(file_config, index):
+        """Invocação duplicada gravando em chave temporária; copia para a final se vencer"""
+        url = file_config['url']
+        final_key = build_s3_key(file_config['prefix'], file_config['filename'])
+        temp_prefix = f"{build_s3_key(file_config['prefix'], HEDGE_TEMP_PREFIX)}{uuid.uuid4().hex}/"
+        temp_key = build_s3_key(temp_prefix, file_config['filename'])
+        result = router.invoke({**file_config, 'prefix': temp_prefix}, index, len(files_to_download))
+        try:
+            result['hedge'] = 'lost'
+            # Claim antes da cópia: um hedge perdedor nunca sobrescreve o objeto da original
+            if result['status'] == 'success' and hedger.claim(url, 'hedge'):
+                result['hedge'] = 'won'
+                try:
+                    # A cópia gerenciada vira multipart acima de 8MB e só leva os ExtraArgs:
+                    # metadados, Content-Type e Content-Encoding vêm do objeto temporário
+                    temp = s3_client.head_object(Bucket=file_config['bucket'], Key=temp_key)
+                    extra_args = {
+                        'ServerSideEncryption': 'AES256',
+                        'Metadata': temp.get('Metadata', {}),
+                        'MetadataDirective': 'REPLACE',
+                        'ContentType': temp.get('ContentType', 'application/octet-stream')
+                    }
+                    if temp.get('ContentEncoding'):
+                        extra_args['ContentEncoding'] = temp['ContentEncoding']
+                    s3_client.copy({'Bucket': file_config['bucket'], 'Key': temp_key}, file_config['bucket'],
+                                   final_key, ExtraArgs=extra_args)
+                    result['result']['s3_location'] = f"s3://{file_config['bucket']}/{final_key}"
+                except Exception as e:
+                    # O arquivo já foi dado ao hedge: registrar a falha em vez de deixá-lo pendente
+                    print(f"💥 {file_config['filename']} - Falha ao promover o hedge: {e}")
+                    result = {**result, 'status': 'exception', 'error': str(e), 'error_type': type(e).__name__}
+        finally:
+            hedger.hedge_finished(url)
+            # Falha na limpeza não pode descartar o resultado da tentativa
+            try:
+                s3_client.delete_object(Bucket=file_config['bucket'], Key=temp_key)
+            except Exception as e:
+                print(f"⚠️ {file_config['filename']} - Não foi possível remover o objeto temporário "
+                      f"s3://{file_config['bucket']}/{temp_key}: {e}")
+        return result
+
+    def record(result, url=None):
+        results.append(result)
+        stats.add(result)
+        if hedger:
+            hedger.record_result(result)
+        if cache and url and not result.get('cached'):
+            update_cache_from_result(cache, url, result, destination_location(config_by_url[url][0]))
+
     # Processar arquivos com ThreadPoolExecutor
     results = []
     start_time = time.time()
+    for result in resolved_results:
+        stats.started()
+        record(result)
 
-    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
-        future_to_file = {
-            executor.submit(
-                invoke_lambda_for_file,
-                lambda_client,
-                function_name,
-                file_config,
-                i + 1,
-                len(files_to_download)
-            ): file_config for i, file_config in enumerate(files_to_download)
-        }
+    executor = ThreadPoolExecutor(max_workers=max_concurrent)
+    hedge_executor = ThreadPoolExecutor(max_workers=hedger.max_in_flight) if hedger else None
+    future_to_file = {
+        executor.submit(run_file, file_config, i + 1): (file_config, i + 1, 'original')
+        for i, file_config in enumerate(files_to_download)
+    }
+    if hedger and cache:
+        # Tamanhos já conhecidos dispensam o HEAD na detecção de stragglers
+        for url, entry in cache.get_many([file_config['url'] for file_config in files_to_download]).items():
+            if entry.get('size'):
+                hedger.sizes_mb[url] = entry['size'] / (1024 * 1024)
+    config_by_url = {file_config['url']: (file_config, index) for file_config, index, _ in future_to_file.values()}
+    pending = set(future_to_file)
+    settled_count = 0
 
-        for future in as_completed(future_to_file):
-            file_config = future_to_file[future]
+    while settled_count < len(files_to_download) and pending:
+        done, pending = wait(pending, timeout=HEDGE_CHECK_INTERVAL if hedger else None,
+                             return_when=FIRST_COMPLETED)
+
+        for future in done:
+            file_config, index, kind = future_to_file.pop(future)
+            url = file_config['url']
             try:
                 result = future.result()
-                results.append(result)
             except Exception as exc:
                 filename = file_config['filename']
                 print(f"💥 {filename} - Exceção na thread: {exc}")
-                results.append({
+                result = {
                     'filename': filename,
                     'status': 'thread_exception',
                     'error': str(exc),
                     'execution_time': 0
-                })
+                }
+
+            if not hedger:
+                record(result, url)
+                settled_count += 1
+            elif kind == 'hedge':
+                if result.get('hedge') == 'won':
+                    outcome = 'hedge venceu' if result['status'] == 'success' else 'hedge venceu, mas a promoção falhou'
+                    print(f"[{index}/{len(files_to_download)}] 🐇 {file_config['filename']} - {outcome}")
+                    record(result, url)
+                    settled_count += 1
+                elif url in hedger.deferred and hedger.claim(url, 'original'):
+                    # Original e hedge falharam: vale o resultado da original
+                    record(hedger.deferred.pop(url), url)
+                    settled_count += 1
+            elif hedger.is_settled(url):
+                print(f"[{index}/{len(files_to_download)}] 🗑️ {file_config['filename']} - "
+                      f"tentativa original descartada (hedge venceu)")
+            elif result['status'] in ERROR_STATUSES and hedger.hedge_running(url):
+                # Falha da original com hedge em andamento: aguardar o hedge
+                hedger.deferred[url] = result
+            elif hedger.claim(url, 'original'):
+                record(result, url)
+                settled_count += 1
+
+        if hedger:
+            for url in hedger.stragglers():
+                file_config, index = config_by_url[url]
+                print(f"[{index}/{len(files_to_download)}] 🐢 {file_config['filename']} - "
+                      f"lento, disparando hedge")
+                future = hedge_executor.submit(run_hedge, file_config, index)
+                future_to_file[future] = (file_config, index, 'hedge')
+                pending.add(future)
+
+    # Tentativas perdedoras ainda em andamento não bloqueiam o relatório
+    executor.shutdown(wait=not hedger)
+    if hedge_executor:
+        hedge_executor.shutdown(wait=False)
 
     total_time = time.time() - start_time
+    if cache:
+        cache.close()
+    stop_snapshots.set()
+    if snapshot_thread:
+        snapshot_thread.join()
+    if metrics_server:
+        metrics_server.shutdown()
+    final_stats = stats.snapshot()
 
     # Relatório final
     print()
@@ -202,39 +1384,111 @@ def process_files_with_config(config):
     print("📈 RELATÓRIO FINAL")
     print("=" * 60)
 
-    success_count = len([r for r in results if r['status'] == 'success'])
-    skipped_count = len([r for r in results if r['status'] == 'skipped'])
-    error_count = len([r for r in results if r['status'] in ['error', 'exception', 'thread_exception']])
+    counts = final_stats['counts']
+    error_count = final_stats['errors']
 
-    print(f"📁 Total de arquivos: {len(results)}")
-    print(f"✅ Sucessos: {success_count}")
-    print(f"⏭️ Ignorados (já existem): {skipped_count}")
+    print(f"📁 Total de arquivos: {final_stats['completed']}")
+    print(f"✅ Sucessos: {counts.get('success', 0)}")
+    print(f"⏭️ Ignorados (já existem): {counts.get('skipped', 0)}")
+    if dedup:
+        dedup_mb = final_stats['mb_by_status'].get('deduplicated', 0)
+        new_contents = len([r for r in results if r['status'] == 'success' and
+                            r['result'].get('stats', {}).get('content_sha256') not in content_index])
+        print(f"♻️ Deduplicados (conteúdo já existente): {counts.get('deduplicated', 0)} "
+              f"({dedup_mb:.1f} MB não enviados)")
+        print(f"🆕 Conteúdos novos no índice: {new_contents}")
+        # Objeto canônico de cada deduplicado, conferido no índice
+        for r in results:
+            content_sha256 = r['status'] == 'deduplicated' and r['result'].get('dedup', {}).get('content_sha256')
+            if not content_sha256 or not dedup_s3_client:
+                continue
+            try:
+                entry = lookup_content_index(dedup_s3_client, bucket_name, content_index, content_sha256,
+                                             dedup_index_prefix)
+            except Exception as e:
+                print(f"   - {r['filename']}: erro ao consultar o índice ({str(e)})")
+                continue
+            if entry:
+                r['canonical'] = f"s3://{entry['bucket']}/{entry['key']}"
+                print(f"   - {r['filename']} → {r['canonical']}")
+            else:
+                print(f"   - {r['filename']}: ⚠️ objeto canônico ausente ou alterado desde a deduplicação")
     print(f"❌ Erros: {error_count}")
     print(f"⏱️ Tempo total: {total_time:.1f}s")
     print()
 
     # Estatísticas de transferência
-    successful_results = [r for r in results if r['status'] == 'success' and 'result' in r]
-    if successful_results:
-        total_mb = sum([r['result'].get('stats', {}).get('size_mb', 0) for r in successful_results])
+    if counts.get('success'):
+        total_mb = final_stats['transferred_mb']
         avg_speed = total_mb / total_time if total_time > 0 else 0
+        execution_p = final_stats['execution_time_seconds']
+        throughput_p = final_stats['throughput_mbps']
         print(f"📈 Estatísticas de transferência:")
         print(f"   - Total transferido: {total_mb:.1f} MB")
         print(f"   - Velocidade média: {avg_speed:.1f} MB/s")
+        print(f"   - Tempo por arquivo (p50/p95/p99): "
+              f"{execution_p['p50']}s / {execution_p['p95']}s / {execution_p['p99']}s")
+        print(f"   - Throughput por arquivo (p50/p95/p99): "
+              f"{throughput_p['p50']} / {throughput_p['p95']} / {throughput_p['p99']} MB/s")
+        print()
+
+    if hedger:
+        hedge_summary = hedger.summary()
+        print(f"🐇 Hedges disparados: {hedge_summary['launched']} (vencedores: {hedge_summary['won']})")
+        print()
+
+    target_summary = router.summary()
+    if len(target_summary) > 1:
+        print("🌎 Distribuição por função:")
+        for target in target_summary:
+            print(f"   - {target['region']}:{target['function_name']}: {target['completed']} arquivo(s), "
+                  f"{target['transferred_mb']:.1f} MB, {target['throughput_mbps'] or 0} MB/s por arquivo")
+        print()
+
+    concurrency_summary = None
+    if controller:
+        concurrency_summary = controller.summary()
+        print(f"🎚️ Concorrência automática:")
+        print(f"   - Limite final: {concurrency_summary['final_limit']}")
+        print(f"   - Melhor limite observado: {concurrency_summary['best_limit']} "
+              f"({concurrency_summary['best_throughput_mbps']} MB/s)")
+        print()
+
+    if final_stats['error_classes']:
+        print("🧾 Erros por classe:")
+        for error_class, count in sorted(final_stats['error_classes'].items(), key=lambda item: -item[1]):
+            print(f"   - {error_class}: {count}")
         print()
 
     # Mostrar erros se houver
     if error_count > 0:
         print("❌ ERROS ENCONTRADOS:")
         for result in results:
-            if result['status'] in ['error', 'exception', 'thread_exception']:
+            if result['status'] in ERROR_STATUSES:
                 filename = result['filename']
                 error = result.get('error', result.get('result', 'Erro desconhecido'))
                 print(f"   - {filename}: {error}")
         print()
 
+    # Recomendação de memória a partir do profiling
+    summary = {'stats': final_stats, 'targets': target_summary}
+    if concurrency_summary:
+        summary['concurrency'] = concurrency_summary
+    if hedger:
+        summary['hedge'] = hedger.summary()
+    if profile:
+        recommendations = recommend_memory_by_size(results)
+        if recommendations:
+            print("🧠 Recomendação de memória por faixa de tamanho:")
+            for rec in recommendations:
+                print(f"   - {rec['size_bucket']}: {rec['files']} arquivo(s), "
+                      f"pico {rec['max_peak_rss_mb']:.1f} MB de {rec['configured_memory_mb']} MB "
+                      f"-> recomendado {rec['recommended_memory_mb']} MB")
+            print()
+            summary['memory_recommendations'] = recommendations
+
     # Salvar resultados
-    save_results_to_file(results)
+    save_results_to_file(results, summary=summary)
     print("🎉 Processamento concluído!")
 
 
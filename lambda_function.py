@@ -1,12 +1,23 @@
 #import sys
 #import subprocess
-import requests
+import time
+
+# Início do carregamento do módulo (init da Lambda), medido antes dos imports
+_MODULE_LOAD_START = time.perf_counter()
+
 import boto3
+import urllib3
 import json
 import logging
 import io
 import os
-import time
+import csv
+import math
+import struct
+import hashlib
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import urlparse
 from botocore.exceptions import ClientError
 
@@ -14,6 +25,1017 @@ from botocore.exceptions import ClientError
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Cliente HTTP enxuto: urllib3 já vem com o botocore no runtime da Lambda,
+# dispensando a layer do requests. O pool é reaproveitado entre invocações.
+USER_AGENT = 'AWS-Lambda-HTTPS-Downloader/1.0'
+HEAD_TIMEOUT = urllib3.Timeout(connect=30, read=30)
+GET_TIMEOUT = urllib3.Timeout(connect=60, read=60)
+# Sem limite total: 3 tentativas por tipo de erro e até 10 redirecionamentos
+HTTP_RETRIES = urllib3.Retry(total=None, connect=3, read=3, other=3, redirect=10, status=0,
+                             raise_on_redirect=True)
+# Por padrão pede a representação sem compressão: um .csv comprimido on-the-fly pela
+# origem não vira objeto gzip (ilegível para Glue/Athena), e arquivos já comprimidos
+# na origem continuam passando sem alteração. Compressão só com accept_compressed.
+IDENTITY_HEADERS = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'}
+COMPRESSED_HEADERS = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'}
+http = urllib3.PoolManager(headers=IDENTITY_HEADERS, retries=HTTP_RETRIES)
+
+# Cliente S3 criado na primeira invocação e reaproveitado nas seguintes
+_s3_client = None
+
+# Quantidade de pontos de alocação Python reportados no profiling
+PROFILE_TOP_ALLOCATIONS = 5
+
+# Modos de deduplicação por conteúdo (hash SHA-256 do arquivo)
+# - skip: não grava nada, apenas aponta para o objeto já existente
+# - copy: cópia server-side do objeto existente para a nova chave
+# - pointer: objeto vazio na nova chave com metadado apontando para o existente
+DEDUP_MODES = ('skip', 'copy', 'pointer')
+DEFAULT_DEDUP_INDEX_PREFIX = '_content-index/'
+
+# Fan-out para múltiplos destinos: tamanho das partes do multipart upload e
+# quantidade máxima de partes mantidas em memória aguardando upload
+FAN_OUT_PART_SIZE = 8 * 1024 * 1024  # 8MB (mínimo do S3 é 5MB)
+FAN_OUT_MAX_PARTS = 10000
+FAN_OUT_MAX_PENDING_PARTS = 4
+FAN_OUT_MAX_WORKERS = 16
+
+# Delta sync de arquivos que crescem por append: bytes finais do objeto armazenado
+# comparados com a origem antes de baixar apenas o trecho novo, e limites do
+# multipart (partes não finais >= 5MB, UploadPartCopy <= 5GB por parte)
+DELTA_TAIL_BYTES = 64 * 1024
+DELTA_PART_SIZE = 8 * 1024 * 1024
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_COPY_PART_SIZE = 5 * 1024 * 1024 * 1024
+
+# Divisão de CSV/texto em objetos menores cortados em fim de linha, para leitura
+# paralela no Glue/Athena; no máximo SPLIT_MAX_PENDING_CHUNKS partes em memória
+SPLIT_DEFAULT_TARGET_MB = 128
+SPLIT_MAX_PENDING_CHUNKS = 2
+SPLIT_MAX_WORKERS = 4
+SPLIT_MANIFEST_NAME = '_manifest.json'
+
+# Índice de registros gravado ao lado do objeto (<s3_key>.idx): offset em bytes do
+# início de cada bloco de N registros e mín/máx da coluna chave no bloco, para
+# leitura com range GET. Formato binário little-endian descrito em _RowIndexer.
+INDEX_MAGIC = b'LDIX'
+INDEX_VERSION = 1
+INDEX_DEFAULT_EVERY_N_RECORDS = 10000
+INDEX_SUFFIX = '.idx'
+INDEX_KEY_TYPES = ('string', 'number')
+
+
+class HTTPStatusError(Exception):
+    """Resposta HTTP com status de erro (4xx/5xx) na origem"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _check_status(response, url):
+    """Equivalente ao raise_for_status do requests para respostas urllib3"""
+    if response.status >= 400:
+        raise HTTPStatusError(f"{response.status} {response.reason} para a URL: {url}", response.status)
+
+
+def _get_s3_client():
+    """Retorna o cliente S3 do container, criando-o na primeira chamada"""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client('s3')
+    return _s3_client
+
+
+def _reset_peak_rss():
+    """
+    Zera o pico de RSS do processo (VmHWM) para medir apenas esta invocação.
+    Retorna False se o kernel não permitir, e o pico passa a ser o do container.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _read_peak_rss_mb():
+    """Lê o pico de RSS do processo em MB (VmHWM, com fallback para getrusage)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss é reportado em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _start_profiling(cpu_times):
+    """Inicia a coleta de memória/CPU da invocação; retorna o escopo do pico de RSS"""
+    cpu_times.clear()
+    cpu_times.update({'http': 0.0, 'processing': 0.0, 's3': 0.0})
+    rss_scope = 'invocation' if _reset_peak_rss() else 'container'
+
+    # Import tardio: o tracemalloc só é necessário com profiling
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return rss_scope
+
+
+def _add_cpu_time(cpu_times, phase, seconds):
+    """Acumula tempo de CPU em uma fase (http, processing, s3) quando o profiling está ativo"""
+    if cpu_times is not None:
+        cpu_times[phase] = cpu_times.get(phase, 0.0) + seconds
+
+
+def _build_profile_stats(cpu_times, rss_scope, context):
+    """Monta o bloco 'profile' das estatísticas: pico de memória, CPU por fase e hot spots"""
+    memory_limit = getattr(context, 'memory_limit_in_mb', None) or os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+
+    profile = {
+        'peak_rss_mb': round(_read_peak_rss_mb(), 2),
+        'peak_rss_scope': rss_scope,
+        'memory_limit_mb': int(memory_limit) if memory_limit else None,
+        'cpu_seconds': {phase: round(seconds, 3) for phase, seconds in cpu_times.items()},
+        'cpu_total_seconds': round(sum(cpu_times.values()), 3)
+    }
+
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        _, python_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profile['python_peak_mb'] = round(python_peak / (1024 * 1024), 2)
+        profile['top_allocations'] = [
+            {
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count
+            }
+            for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]
+        ]
+
+    return profile
+
+
+def _stop_profiling():
+    """Garante que o tracemalloc não fique ativo entre invocações do mesmo container"""
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _init_stats():
+    """Informa se a invocação é cold start e, nesse caso, a duração do init do módulo"""
+    global _COLD_START
+    stats = {'cold_start': _COLD_START}
+    if _COLD_START:
+        stats['init_duration_ms'] = round(_INIT_DURATION * 1000, 1)
+        _COLD_START = False
+    return stats
+
+
+def _object_exists(s3_client, bucket, key):
+    """Verifica se o objeto existe no S3 (HEAD), propagando erros diferentes de 404"""
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != '404':
+            raise
+        return False
+
+
+def _content_index_key(index_prefix, content_sha256):
+    """Chave da entrada do índice hash→chave para um conteúdo"""
+    return f"{index_prefix}sha256/{content_sha256}.json"
+
+
+def _lookup_content_index(s3_client, bucket, index_prefix, content_sha256):
+    """
+    Consulta o índice de conteúdo no S3.
+    Retorna a entrada se o hash já foi armazenado e o objeto canônico ainda tem esse conteúdo.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=_content_index_key(index_prefix, content_sha256))
+        entry = json.loads(response['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        return None
+
+    # Entrada obsoleta: o objeto canônico foi removido, sobrescrito ou alterado por delta sync
+    try:
+        head = s3_client.head_object(Bucket=entry['bucket'], Key=entry['key'])
+    except ClientError as e:
+        if e.response['Error']['Code'] != '404':
+            raise
+        return None
+    if head.get('Metadata', {}).get('content-sha256') != content_sha256:
+        return None
+
+    return entry
+
+
+def _register_content(s3_client, bucket, index_prefix, content_sha256, entry):
+    """Grava a entrada hash→chave no índice de conteúdo"""
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=_content_index_key(index_prefix, content_sha256),
+        Body=json.dumps(entry).encode('utf-8'),
+        ContentType='application/json',
+        ServerSideEncryption='AES256'
+    )
+
+
+def _write_dedup_object(s3_client, mode, entry, bucket, s3_key, metadata, content_args):
+    """Materializa um conteúdo já existente na nova chave (cópia server-side ou ponteiro)"""
+    canonical_location = f"s3://{entry['bucket']}/{entry['key']}"
+
+    if mode == 'copy':
+        s3_client.copy(
+            {'Bucket': entry['bucket'], 'Key': entry['key']},
+            bucket,
+            s3_key,
+            ExtraArgs={
+                'ServerSideEncryption': 'AES256',
+                'Metadata': {**metadata, 'dedup-of': canonical_location},
+                'MetadataDirective': 'REPLACE',
+                **content_args
+            }
+        )
+    elif mode == 'pointer':
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=s3_key,
+            Body=b'',
+            ServerSideEncryption='AES256',
+            Metadata={**metadata, 'dedup-of': canonical_location},
+            **content_args
+        )
+
+
+def _build_s3_key(prefix, filename):
+    """Monta a chave S3 a partir do prefixo (com ou sem '/') e do nome do arquivo"""
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    return f"{prefix}{filename}" if prefix else filename
+
+
+def _encryption_args(encryption, kms_key_id=None):
+    """Argumentos de criptografia server-side para put/multipart upload"""
+    args = {'ServerSideEncryption': encryption}
+    if encryption == 'aws:kms' and kms_key_id:
+        args['SSEKMSKeyId'] = kms_key_id
+    return args
+
+
+def _parse_destinations(destinations, default_bucket, default_prefix, default_filename):
+    """
+    Normaliza a lista de destinos do evento.
+    Cada destino aceita bucket, prefix, filename ou key, encryption e kms_key_id;
+    campos omitidos herdam os valores principais do evento.
+    """
+    if not isinstance(destinations, list) or not destinations:
+        raise ValueError('Parâmetro "destinations" deve ser uma lista não vazia')
+
+    parsed = []
+    for i, dest in enumerate(destinations):
+        if not isinstance(dest, dict):
+            raise ValueError(f'Destino {i} deve ser um objeto')
+        dest_bucket = dest.get('bucket') or default_bucket
+        if not dest_bucket:
+            raise ValueError(f'Destino {i} sem "bucket"')
+        key = dest.get('key') or _build_s3_key(dest.get('prefix', default_prefix),
+                                               dest.get('filename', default_filename))
+        parsed.append({
+            'bucket': dest_bucket,
+            'key': key,
+            'encryption': _encryption_args(dest.get('encryption', 'AES256'), dest.get('kms_key_id'))
+        })
+
+    locations = [f"s3://{d['bucket']}/{d['key']}" for d in parsed]
+    if len(set(locations)) != len(locations):
+        raise ValueError('Parâmetro "destinations" contém destinos repetidos')
+
+    return parsed
+
+
+def _stream_to_destinations(s3_client, chunks, destinations, metadata, content_args, file_size):
+    """
+    Envia um único stream de download para vários destinos S3 em paralelo.
+
+    O stream é cortado em partes; cada parte é enviada a todos os destinos
+    (multipart upload por destino) e no máximo FAN_OUT_MAX_PENDING_PARTS partes
+    ficam em memória aguardando upload. Arquivos menores que uma parte usam
+    put_object. Falha em um destino não interrompe os demais.
+
+    Retorna (bytes transferidos, lista de resultados por destino).
+    """
+    part_size = FAN_OUT_PART_SIZE
+    if file_size:
+        part_size = max(part_size, math.ceil(file_size / FAN_OUT_MAX_PARTS))
+
+    for dest in destinations:
+        dest.update({'upload_id': None, 'parts': [], 'error': None})
+
+    pending = threading.BoundedSemaphore(FAN_OUT_MAX_PENDING_PARTS)
+    futures = []
+    total_bytes = 0
+    part_number = 0
+    buffer = bytearray()
+
+    def _fail(dest, exc):
+        if not dest['error']:
+            dest['error'] = str(exc)
+            logger.error(f"❌ Falha no destino s3://{dest['bucket']}/{dest['key']}: {str(exc)}")
+
+    def _abort(dest):
+        try:
+            s3_client.abort_multipart_upload(Bucket=dest['bucket'], Key=dest['key'], UploadId=dest['upload_id'])
+        except Exception as e:
+            logger.error(f"❌ Falha ao abortar multipart em s3://{dest['bucket']}/{dest['key']}: {str(e)}")
+
+    def _upload_part(dest, number, data):
+        if dest['error']:
+            return
+        try:
+            response = s3_client.upload_part(Bucket=dest['bucket'], Key=dest['key'], UploadId=dest['upload_id'],
+                                             PartNumber=number, Body=data)
+            dest['parts'].append({'PartNumber': number, 'ETag': response['ETag']})
+        except Exception as e:
+            _fail(dest, e)
+
+    def _submit_part(executor, data):
+        nonlocal part_number
+        part_number += 1
+
+        # Bloqueia o download enquanto houver partes demais aguardando upload
+        pending.acquire()
+        remaining = [len(destinations)]
+        lock = threading.Lock()
+
+        def _part_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    pending.release()
+
+        for dest in destinations:
+            future = executor.submit(_upload_part, dest, part_number, data)
+            future.add_done_callback(_part_done)
+            futures.append(future)
+
+    def _create_uploads():
+        for dest in destinations:
+            try:
+                response = s3_client.create_multipart_upload(Bucket=dest['bucket'], Key=dest['key'],
+                                                             Metadata=metadata, **content_args,
+                                                             **dest['encryption'])
+                dest['upload_id'] = response['UploadId']
+            except Exception as e:
+                _fail(dest, e)
+
+    with ThreadPoolExecutor(max_workers=min(FAN_OUT_MAX_WORKERS, len(destinations) * 4)) as executor:
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                buffer += chunk
+                total_bytes += len(chunk)
+
+                if len(buffer) >= part_size:
+                    if part_number == 0:
+                        _create_uploads()
+                    _submit_part(executor, bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+        except Exception:
+            # Download interrompido: descartar multipart uploads já iniciados
+            wait(futures)
+            for dest in destinations:
+                if dest['upload_id']:
+                    _abort(dest)
+            raise
+
+        if part_number == 0:
+            # Arquivo pequeno: upload simples para cada destino
+            data = bytes(buffer)
+            single = {
+                executor.submit(s3_client.put_object, Bucket=dest['bucket'], Key=dest['key'], Body=data,
+                                Metadata=metadata, **content_args, **dest['encryption']): dest
+                for dest in destinations
+            }
+            for future, dest in single.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    _fail(dest, e)
+        else:
+            if buffer:
+                _submit_part(executor, bytes(buffer))
+            wait(futures)
+
+    results = []
+    for dest in destinations:
+        location = f"s3://{dest['bucket']}/{dest['key']}"
+        if dest['upload_id']:
+            try:
+                if dest['error']:
+                    raise RuntimeError(dest['error'])
+                s3_client.complete_multipart_upload(
+                    Bucket=dest['bucket'], Key=dest['key'], UploadId=dest['upload_id'],
+                    MultipartUpload={'Parts': sorted(dest['parts'], key=lambda p: p['PartNumber'])}
+                )
+            except Exception as e:
+                _fail(dest, e)
+                _abort(dest)
+
+        if dest['error']:
+            results.append({'s3_location': location, 'status': 'failed', 'error': dest['error']})
+        else:
+            results.append({'s3_location': location, 'status': 'completed'})
+
+    return total_bytes, results
+
+
+def _parse_quotechar(options, parameter):
+    """Caractere de aspas da configuração (padrão '"'); None trata cada linha como registro"""
+    quotechar = options.get('quotechar', '"')
+    if quotechar is not None and (not isinstance(quotechar, str) or len(quotechar.encode('utf-8')) != 1):
+        raise ValueError(f'Parâmetro "{parameter}.quotechar" deve ser um único caractere ou null')
+    return quotechar
+
+
+class _RecordScanner:
+    """
+    Encontra fins de registro num buffer que cresce: um registro termina no primeiro
+    fim de linha fora de aspas (campos CSV entre aspas podem conter quebras de linha).
+    Retoma de onde parou a cada chamada; sem quote, toda linha é um registro.
+    """
+
+    def __init__(self, quote):
+        self.quote = quote
+        self.position = 0
+        self.in_quotes = False
+
+    def next_end(self, buffer):
+        """Posição logo após o próximo fim de registro ainda não visto (None se não houver)"""
+        while True:
+            newline = buffer.find(b'\n', self.position)
+            if newline == -1:
+                return None
+            # Aspas escapadas ("") não alteram a paridade
+            if self.quote and buffer.count(self.quote, self.position, newline) % 2:
+                self.in_quotes = not self.in_quotes
+            self.position = newline + 1
+            if not self.in_quotes:
+                return self.position
+
+    def skip_plain(self, buffer, limit):
+        """
+        Avança de uma vez pelos registros que terminam até limit num trecho sem aspas
+        (onde todo fim de linha encerra um registro). Retorna quantos registros pulou.
+        """
+        if self.in_quotes:
+            return 0
+        stop = limit
+        if self.quote:
+            quote = buffer.find(self.quote, self.position, limit)
+            if quote != -1:
+                stop = quote
+        last = buffer.rfind(b'\n', self.position, stop)
+        if last == -1:
+            return 0
+        skipped = buffer.count(b'\n', self.position, last + 1)
+        self.position = last + 1
+        return skipped
+
+    def consume(self, size):
+        """Descontar size bytes removidos do início do buffer (sempre num fim de registro)"""
+        self.position -= size
+
+    def reset(self):
+        self.position = 0
+        self.in_quotes = False
+
+
+def _parse_split(split, prefix, filename):
+    """
+    Normaliza a configuração de divisão do evento (true ou objeto com target_size_mb,
+    header, repeat_header, quotechar e prefix). Por padrão as partes ficam em <prefix>/<nome sem extensão>/.
+    """
+    if split is True:
+        split = {}
+    if not isinstance(split, dict):
+        raise ValueError('Parâmetro "split" deve ser true ou um objeto')
+
+    target_size_mb = split.get('target_size_mb', SPLIT_DEFAULT_TARGET_MB)
+    if not isinstance(target_size_mb, (int, float)) or target_size_mb <= 0:
+        raise ValueError('Parâmetro "split.target_size_mb" deve ser um número positivo')
+
+    base_name, extension = os.path.splitext(filename)
+    split_prefix = split.get('prefix') or _build_s3_key(prefix, base_name)
+    if not split_prefix.endswith('/'):
+        split_prefix += '/'
+
+    repeat_header = bool(split.get('repeat_header', False))
+    return {
+        'target_size': int(target_size_mb * 1024 * 1024),
+        # Primeira linha é cabeçalho (não conta como registro); repeat_header implica cabeçalho
+        'header': bool(split.get('header', True)) or repeat_header,
+        'repeat_header': repeat_header,
+        'quotechar': _parse_quotechar(split, 'split'),
+        'prefix': split_prefix,
+        'base_name': base_name,
+        'extension': extension,
+        'manifest_key': f"{split_prefix}{SPLIT_MANIFEST_NAME}"
+    }
+
+
+def _split_to_objects(s3_client, chunks, bucket, split, metadata, content_type):
+    """
+    Corta o stream em objetos de aproximadamente split['target_size'] bytes,
+    sempre em fim de registro (fim de linha fora de aspas, como no índice),
+    repetindo o cabeçalho em cada parte se pedido.
+    As partes são enviadas em paralelo e a memória fica limitada a poucas partes.
+
+    Retorna (bytes lidos, lista de partes com key, size e records).
+    """
+    target_size = split['target_size']
+    pending = threading.BoundedSemaphore(SPLIT_MAX_PENDING_CHUNKS)
+    parts = []
+    futures = []
+    buffer = bytearray()
+    header = None
+    total_bytes = 0
+    scanner = _RecordScanner(split['quotechar'].encode('utf-8') if split['quotechar'] else None)
+    # Último fim de registro dentro do tamanho alvo e registros até ele
+    part_end = None
+    part_records = 0
+
+    def _upload(key, data):
+        try:
+            s3_client.put_object(Bucket=bucket, Key=key, Body=data, ServerSideEncryption='AES256',
+                                 Metadata=metadata, ContentType=content_type)
+        finally:
+            pending.release()
+
+    def _scan(limit):
+        """Avança part_end/part_records até limit; retorna o primeiro fim de registro após limit"""
+        nonlocal header, part_end, part_records
+        while True:
+            # O cabeçalho é o primeiro registro: só pular trechos depois de conhecê-lo
+            if header is not None or not split['header']:
+                skipped = scanner.skip_plain(buffer, limit)
+                if skipped:
+                    part_end, part_records = scanner.position, part_records + skipped
+            end = scanner.next_end(buffer)
+            if end is None:
+                return None
+            if split['header'] and header is None:
+                header = bytes(buffer[:end])
+            if end > limit:
+                return end
+            part_end, part_records = end, part_records + 1
+
+    def _submit(executor, data, records):
+        number = len(parts)
+        # Registros contados nos bytes originais da parte: o cabeçalho só está na primeira
+        if header and number == 0:
+            records -= 1
+        if split['repeat_header'] and header and number > 0:
+            data = header + data
+        key = f"{split['prefix']}{split['base_name']}-part-{number:05d}{split['extension']}"
+        parts.append({'key': key, 'size': len(data), 'records': records})
+
+        # Bloqueia o download enquanto houver partes demais aguardando upload
+        pending.acquire()
+        futures.append(executor.submit(_upload, key, data))
+
+    with ThreadPoolExecutor(max_workers=SPLIT_MAX_WORKERS) as executor:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffer += chunk
+            total_bytes += len(chunk)
+
+            while len(buffer) >= target_size:
+                # Último fim de registro dentro do tamanho alvo (ou o primeiro após, para registros longos)
+                end = _scan(target_size)
+                if end is None:
+                    break
+                cut = (part_end, part_records) if part_end else (end, part_records + 1)
+                _submit(executor, bytes(buffer[:cut[0]]), cut[1])
+                del buffer[:cut[0]]
+                # O corte é sempre num fim de registro: reavaliar o restante a partir do início
+                scanner.reset()
+                part_end, part_records = None, 0
+
+        if buffer:
+            _scan(len(buffer))
+            # Último registro sem fim de linha (ou com aspas não fechadas)
+            if part_end != len(buffer):
+                part_records += 1
+            # Arquivo de um único registro sem fim de linha: é só o cabeçalho
+            if split['header'] and header is None:
+                header = bytes(buffer)
+            _submit(executor, bytes(buffer), part_records)
+
+        # Propaga a primeira falha de upload
+        for future in futures:
+            future.result()
+
+    return total_bytes, parts
+
+
+def _parse_index(index, s3_key):
+    """
+    Normaliza a configuração do índice do evento (true ou objeto com every_n_records,
+    key_column, key_type, delimiter, quotechar, header e key). Por padrão o índice fica em <s3_key>.idx.
+    """
+    if index is True:
+        index = {}
+    if not isinstance(index, dict):
+        raise ValueError('Parâmetro "index" deve ser true ou um objeto')
+
+    every_n_records = index.get('every_n_records', INDEX_DEFAULT_EVERY_N_RECORDS)
+    if not isinstance(every_n_records, int) or every_n_records <= 0:
+        raise ValueError('Parâmetro "index.every_n_records" deve ser um inteiro positivo')
+
+    key_type = index.get('key_type', 'string')
+    if key_type not in INDEX_KEY_TYPES:
+        raise ValueError(f'Parâmetro "index.key_type" deve ser um de {list(INDEX_KEY_TYPES)}')
+
+    delimiter = index.get('delimiter', ',')
+    if not isinstance(delimiter, str) or len(delimiter.encode('utf-8')) != 1:
+        raise ValueError('Parâmetro "index.delimiter" deve ser um único caractere')
+
+    quotechar = _parse_quotechar(index, 'index')
+
+    key_column = index.get('key_column')
+    header = bool(index.get('header', True))
+    if isinstance(key_column, str) and not header:
+        raise ValueError('Parâmetro "index.key_column" por nome exige "index.header"')
+
+    return {
+        'every_n_records': every_n_records,
+        'key_column': key_column,
+        'key_type': key_type,
+        'delimiter': delimiter,
+        'quotechar': quotechar,
+        'header': header,
+        'key': index.get('key') or f"{s3_key}{INDEX_SUFFIX}"
+    }
+
+
+class _RowIndexer:
+    """
+    Indexa CSV/texto enquanto os bytes passam pelo download, sem segunda leitura.
+
+    A cada every_n_records registros (sem contar o cabeçalho) inicia um bloco com
+    o offset em bytes do seu primeiro registro; com key_column, guarda também o
+    mínimo e o máximo da coluna no bloco. Um registro termina no primeiro fim de
+    linha fora de aspas (quotechar), então campos com quebras de linha não
+    deslocam a numeração; sem quotechar cada linha é um registro.
+
+    Formato do objeto .idx (little-endian):
+    - cabeçalho: magic 'LDIX', versão (B), flags (B: 1 = tem chave, 2 = chave numérica),
+      every_n_records (I), registros (Q), linhas (Q), bytes (Q), offset do primeiro
+      registro (Q), blocos (I) e nome da coluna chave (H + UTF-8)
+    - por bloco: primeiro registro (Q) e offset (Q); com chave, mín e máx como
+      dois doubles (d) ou duas strings (H + bytes). Blocos sem valor de chave
+      válido têm mín/máx NaN ou vazios.
+
+    read_index lê esse formato.
+    """
+
+    def __init__(self, config):
+        self.every_n_records = config['every_n_records']
+        self.key_column = config['key_column']
+        self.numeric = config['key_type'] == 'number'
+        self.delimiter = config['delimiter']
+        self.delimiter_bytes = config['delimiter'].encode('utf-8')
+        self.quotechar = config.get('quotechar', '"')
+        self.quote = self.quotechar.encode('utf-8') if self.quotechar else None
+        self.header = config['header']
+        self.header_done = not config['header']
+        self.key_name = config['key_column'] if isinstance(config['key_column'], str) else ''
+        self.column = config['key_column'] if isinstance(config['key_column'], int) else None
+        self.pending = bytearray()
+        self.scanner = _RecordScanner(self.quote)
+        self.offset = 0
+        self.data_offset = 0
+        self.lines = 0
+        self.records = 0
+        self.blocks = []
+
+    def _parse(self, record):
+        if self.quote:
+            reader = csv.reader([record.decode('utf-8', errors='replace')], delimiter=self.delimiter,
+                                quotechar=self.quotechar)
+        else:
+            reader = csv.reader([record.decode('utf-8', errors='replace')], delimiter=self.delimiter,
+                                quoting=csv.QUOTE_NONE)
+        return next(reader, [])
+
+    def _field(self, record):
+        if self.quote and self.quote in record:
+            fields = self._parse(record)
+            value = fields[self.column] if self.column < len(fields) else ''
+            return value.strip().encode('utf-8')
+        fields = record.split(self.delimiter_bytes)
+        return fields[self.column].strip() if self.column < len(fields) else b''
+
+    def _record(self, record, length):
+        start = self.offset
+        self.offset += length
+        record = record.rstrip(b'\r\n')
+
+        if not self.header_done:
+            self.header_done = True
+            self.data_offset = self.offset
+            if self.key_name:
+                names = self._parse(record)
+                names = [name.strip() for name in names]
+                if self.key_name not in names:
+                    raise ValueError(f'Coluna "{self.key_name}" não encontrada no cabeçalho')
+                self.column = names.index(self.key_name)
+            return
+
+        if self.records % self.every_n_records == 0:
+            self.blocks.append([self.records, start, None, None])
+        self.records += 1
+
+        if self.column is None or not record:
+            return
+        value = self._field(record)
+        if self.numeric:
+            try:
+                value = float(value)
+            except ValueError:
+                return
+            if math.isnan(value):
+                return
+        elif not value:
+            return
+        block = self.blocks[-1]
+        if block[2] is None or value < block[2]:
+            block[2] = value
+        if block[3] is None or value > block[3]:
+            block[3] = value
+
+    def update(self, chunk):
+        self.pending += chunk
+        self.lines += chunk.count(b'\n')
+        start = 0
+        end = self.scanner.next_end(self.pending)
+        while end is not None:
+            self._record(bytes(self.pending[start:end]), end - start)
+            start = end
+            end = self.scanner.next_end(self.pending)
+        if start:
+            del self.pending[:start]
+            self.scanner.consume(start)
+
+    def finish(self):
+        """Processa o último registro (sem fim de linha) e retorna o índice serializado"""
+        if self.pending:
+            # Último registro sem fim de linha (ou com aspas não fechadas até o fim do arquivo)
+            if not self.pending.endswith(b'\n'):
+                self.lines += 1
+            self._record(bytes(self.pending), len(self.pending))
+            self.pending = bytearray()
+
+        has_key = self.column is not None
+        flags = (1 if has_key else 0) | (2 if has_key and self.numeric else 0)
+        key_name = self.key_name.encode('utf-8') if has_key else b''
+        out = io.BytesIO()
+        out.write(INDEX_MAGIC)
+        out.write(struct.pack('<BBIQQQQIH', INDEX_VERSION, flags, self.every_n_records, self.records,
+                              self.lines, self.offset, self.data_offset, len(self.blocks), len(key_name)))
+        out.write(key_name)
+        for first_record, offset, minimum, maximum in self.blocks:
+            out.write(struct.pack('<QQ', first_record, offset))
+            if not has_key:
+                continue
+            if self.numeric:
+                out.write(struct.pack('<dd', math.nan if minimum is None else minimum,
+                                      math.nan if maximum is None else maximum))
+            else:
+                for value in (minimum or b'', maximum or b''):
+                    value = value[:0xFFFF]
+                    out.write(struct.pack('<H', len(value)))
+                    out.write(value)
+        return out.getvalue()
+
+
+def read_index(data):
+    """
+    Lê um índice .idx gravado por _RowIndexer.
+
+    Retorna dict com every_n_records, records, lines, size, data_offset, key_column
+    (None sem chave), key_type e blocks: lista de {first_record, offset, min, max}.
+    Chaves string ficam em bytes (a ordem usada no mín/máx); numéricas em float.
+    Os bytes de um bloco vão de offset até o offset do bloco seguinte (ou size).
+    """
+    if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        raise ValueError('Índice inválido: magic ausente')
+    position = len(INDEX_MAGIC)
+    header_format = '<BBIQQQQIH'
+    (version, flags, every_n_records, records, lines, size, data_offset,
+     block_count, key_name_length) = struct.unpack_from(header_format, data, position)
+    if version != INDEX_VERSION:
+        raise ValueError(f'Versão de índice não suportada: {version}')
+    position += struct.calcsize(header_format)
+    key_name = data[position:position + key_name_length].decode('utf-8')
+    position += key_name_length
+
+    has_key = bool(flags & 1)
+    numeric = bool(flags & 2)
+    blocks = []
+    for _ in range(block_count):
+        first_record, offset = struct.unpack_from('<QQ', data, position)
+        position += 16
+        block = {'first_record': first_record, 'offset': offset, 'min': None, 'max': None}
+        if has_key and numeric:
+            minimum, maximum = struct.unpack_from('<dd', data, position)
+            position += 16
+            if not math.isnan(minimum):
+                block['min'], block['max'] = minimum, maximum
+        elif has_key:
+            values = []
+            for _ in range(2):
+                length, = struct.unpack_from('<H', data, position)
+                values.append(data[position + 2:position + 2 + length])
+                position += 2 + length
+            if values[0] or values[1]:
+                block['min'], block['max'] = values
+        blocks.append(block)
+
+    return {
+        'every_n_records': every_n_records,
+        'records': records,
+        'lines': lines,
+        'size': size,
+        'data_offset': data_offset,
+        'key_column': (key_name or None) if has_key else None,
+        'key_type': ('number' if numeric else 'string') if has_key else None,
+        'blocks': blocks
+    }
+
+
+def _fetch_range(url, start, end):
+    """Baixa o intervalo [start, end] da origem; retorna None se range requests não forem suportadas"""
+    headers = {**IDENTITY_HEADERS, 'Range': f"bytes={start}-{end}"}
+    response = http.request('GET', url, headers=headers, timeout=GET_TIMEOUT, preload_content=False)
+    try:
+        _check_status(response, url)
+        # Origem que ignora Range responde 200 com o arquivo inteiro: não ler o corpo
+        if response.status != 206:
+            return None
+        return response.read()
+    finally:
+        response.release_conn()
+
+
+def _append_to_object(s3_client, bucket, key, stored, chunks, metadata, expected_bytes):
+    """
+    Reescreve o objeto como (conteúdo atual + novos bytes) sem baixá-lo:
+    o conteúdo atual entra via UploadPartCopy e os novos bytes via upload_part.
+    Objetos menores que a parte mínima do S3 são lidos e reenviados junto com o trecho novo.
+    Se o trecho recebido não tiver expected_bytes, o upload é abortado e o objeto fica intacto.
+
+    Retorna a quantidade de bytes acrescentados.
+    """
+    stored_size = stored['ContentLength']
+    copy_source = {'Bucket': bucket, 'Key': key}
+
+    upload = s3_client.create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        ServerSideEncryption='AES256',
+        Metadata=metadata,
+        ContentType=stored.get('ContentType', 'application/octet-stream')
+    )
+    upload_id = upload['UploadId']
+    parts = []
+    buffer = bytearray()
+    appended = 0
+
+    def _upload_buffered(data):
+        response = s3_client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id,
+                                         PartNumber=len(parts) + 1, Body=data)
+        parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+
+    try:
+        if stored_size >= S3_MIN_PART_SIZE:
+            # Cópia server-side em partes iguais de até 5GB (todas >= 5MB)
+            copy_parts = math.ceil(stored_size / S3_MAX_COPY_PART_SIZE)
+            copy_part_size = math.ceil(stored_size / copy_parts)
+            for offset in range(0, stored_size, copy_part_size):
+                end = min(offset + copy_part_size, stored_size) - 1
+                response = s3_client.upload_part_copy(
+                    Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1,
+                    CopySource=copy_source, CopySourceRange=f"bytes={offset}-{end}",
+                    CopySourceIfMatch=stored['ETag']
+                )
+                parts.append({'PartNumber': len(parts) + 1, 'ETag': response['CopyPartResult']['ETag']})
+        else:
+            existing = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=stored['ETag'])
+            buffer += existing['Body'].read()
+
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffer += chunk
+            appended += len(chunk)
+            if len(buffer) >= DELTA_PART_SIZE:
+                _upload_buffered(bytes(buffer[:DELTA_PART_SIZE]))
+                del buffer[:DELTA_PART_SIZE]
+
+        if appended != expected_bytes:
+            raise HTTPStatusError(f"Trecho novo com tamanho inesperado: {appended} != {expected_bytes} bytes")
+
+        if buffer:
+            _upload_buffered(bytes(buffer))
+
+        s3_client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                            MultipartUpload={'Parts': parts})
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    return appended
+
+
+def _delta_sync(s3_client, url, bucket, key):
+    """
+    Sincroniza um arquivo que cresce por append com o objeto já existente no S3.
+
+    Compara o content-length da origem com o metadado file-size do objeto e,
+    se a origem cresceu e os últimos DELTA_TAIL_BYTES armazenados forem iguais
+    aos da origem, baixa apenas o trecho novo e o acrescenta ao objeto.
+
+    Retorna dict com o resultado ('up_to_date' ou 'appended') ou None quando o
+    delta não é aplicável e o arquivo deve ser baixado por completo.
+    """
+    stored = s3_client.head_object(Bucket=bucket, Key=key)
+    stored_size = stored['ContentLength']
+    metadata = stored.get('Metadata', {})
+
+    if stored.get('ContentEncoding'):
+        logger.info("🔁 Delta indisponível: objeto armazenado com Content-Encoding")
+        return None
+    if metadata.get('file-size') != str(stored_size):
+        logger.info("🔁 Delta indisponível: metadado file-size ausente ou divergente do objeto")
+        return None
+
+    head_response = http.request('HEAD', url, headers=IDENTITY_HEADERS, timeout=HEAD_TIMEOUT)
+    _check_status(head_response, url)
+    content_length = head_response.headers.get('content-length')
+    if head_response.headers.get('content-encoding') or not content_length:
+        logger.info("🔁 Delta indisponível: origem sem content-length ou com Content-Encoding")
+        return None
+    remote_size = int(content_length)
+
+    result = {'stored_size': stored_size, 'remote_size': remote_size}
+    if remote_size == stored_size:
+        return {**result, 'status': 'up_to_date', 'appended_bytes': 0}
+    if remote_size < stored_size:
+        logger.info(f"🔁 Origem menor que o objeto armazenado ({remote_size} < {stored_size}): não é append")
+        return None
+
+    # Validar que o início do arquivo não mudou comparando o final já armazenado
+    tail_start = max(0, stored_size - DELTA_TAIL_BYTES)
+    remote_tail = _fetch_range(url, tail_start, stored_size - 1)
+    if remote_tail is None:
+        logger.info("🔁 Delta indisponível: origem não suporta range requests")
+        return None
+    stored_tail = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={tail_start}-{stored_size - 1}",
+                                       IfMatch=stored['ETag'])['Body'].read()
+    if hashlib.sha256(remote_tail).digest() != hashlib.sha256(stored_tail).digest():
+        logger.info("🔁 Delta indisponível: final do arquivo armazenado difere da origem")
+        return None
+
+    logger.info(f"➕ Baixando apenas o trecho novo: bytes {stored_size}-{remote_size - 1}")
+    # Intervalo fechado: a origem pode ter crescido de novo desde o HEAD
+    headers = {**IDENTITY_HEADERS, 'Range': f"bytes={stored_size}-{remote_size - 1}"}
+    with http.request('GET', url, headers=headers, timeout=GET_TIMEOUT, preload_content=False) as response:
+        _check_status(response, url)
+        if response.status != 206:
+            return None
+
+        new_metadata = {k: v for k, v in metadata.items() if k != 'content-sha256'}
+        new_metadata.update({'download-date': str(int(time.time())), 'file-size': str(remote_size)})
+        appended = _append_to_object(s3_client, bucket, key, stored, response.stream(64 * 1024), new_metadata,
+                                     remote_size - stored_size)
+
+    return {**result, 'status': 'appended', 'appended_bytes': appended}
+
 
 def lambda_handler(event, context):
     """
@@ -24,13 +1046,43 @@ def lambda_handler(event, context):
     - bucket: nome do bucket S3 (opcional, pode usar variável de ambiente)
     - prefix: prefixo/pasta no S3 (opcional, pode usar variável de ambiente)
     - filename: nome do arquivo no S3 (opcional, extrai da URL se não fornecido)
+    - profile: se true, inclui pico de memória, CPU por fase e hot spots de alocação em stats (opcional)
+    - dedup: deduplicação por conteúdo: 'skip', 'copy' ou 'pointer' (opcional, desligada por padrão)
+    - dedup_index_prefix: prefixo do índice hash→chave no bucket (opcional, padrão '_content-index/')
+    - decode_content: se true, decodifica o Content-Encoding (gzip/deflate) da origem antes de gravar;
+      por padrão os bytes são gravados como recebidos e o Content-Encoding é copiado para o objeto
+    - accept_compressed: se true, aceita compressão gzip/deflate da origem (Accept-Encoding); sem
+      decode_content o objeto fica comprimido. Por padrão pede a representação sem compressão (opcional)
+    - delta_sync: se true e o objeto já existir, baixa apenas os bytes acrescentados na origem
+      (arquivos que crescem por append) em vez de ignorar o arquivo (opcional)
+    - split: divide CSV/texto em objetos de tamanho alvo cortados em fim de registro, com manifest;
+      true ou {target_size_mb, header, repeat_header, quotechar, prefix}
+      (opcional; o conteúdo é sempre decodificado)
+    - destinations: lista de destinos para um único download, cada um com bucket, prefix,
+      filename ou key, encryption ('AES256' ou 'aws:kms') e kms_key_id (opcional)
+    - index: grava <s3_key>.idx com o offset de cada N registros e mín/máx de uma coluna por bloco;
+      true ou {every_n_records, key_column, key_type, delimiter, header, key}
+      (opcional; o conteúdo é sempre decodificado)
     """
 
+    # Cold start e duração do init (consumido uma única vez por container)
+    init_stats = _init_stats()
+
     # Obter parâmetros do evento ou variáveis de ambiente
     url = event.get('url')
     bucket = event.get('bucket') or os.environ.get('S3_BUCKET')
     prefix = event.get('prefix') or os.environ.get('S3_PREFIX', '')
     custom_filename = event.get('filename')
+    profile_enabled = bool(event.get('profile', False))
+    dedup_mode = event.get('dedup') or os.environ.get('DEDUP_MODE')
+    destinations = event.get('destinations')
+    decode_content = bool(event.get('decode_content', False))
+    accept_compressed = bool(event.get('accept_compressed', False))
+    delta_sync = bool(event.get('delta_sync', False))
+    split = event.get('split')
+    index = event.get('index')
+    dedup_index_prefix = (event.get('dedup_index_prefix') or
+                          os.environ.get('DEDUP_INDEX_PREFIX', DEFAULT_DEDUP_INDEX_PREFIX))
 
     # Validações
     if not url:
@@ -47,7 +1099,7 @@ def lambda_handler(event, context):
             })
         }
 
-    if not bucket:
+    if not bucket and not destinations:
         return {
             'statusCode': 400,
             'body': json.dumps({
@@ -55,6 +1107,18 @@ def lambda_handler(event, context):
             })
         }
 
+    if dedup_mode and dedup_mode not in DEDUP_MODES:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': f'Parâmetro "dedup" inválido: {dedup_mode}',
+                'valid_values': list(DEDUP_MODES)
+            })
+        }
+
+    if dedup_index_prefix and not dedup_index_prefix.endswith('/'):
+        dedup_index_prefix += '/'
+
     # Extrair nome do arquivo da URL se não fornecido
     if custom_filename:
         filename = custom_filename
@@ -65,22 +1129,155 @@ def lambda_handler(event, context):
             filename = 'downloaded_file'
 
     # Construir chave S3
-    if prefix and not prefix.endswith('/'):
-        prefix += '/'
-    s3_key = f"{prefix}{filename}" if prefix else filename
+    s3_key = _build_s3_key(prefix, filename)
+
+    if destinations:
+        try:
+            destinations = _parse_destinations(destinations, bucket, prefix, filename)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+
+        if dedup_mode:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Parâmetro "dedup" não é suportado junto com "destinations"'})
+            }
+
+    if split:
+        if destinations or dedup_mode or delta_sync:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({
+                    'error': 'Parâmetro "split" não é suportado junto com "destinations", "dedup" ou "delta_sync"'
+                })
+            }
+        try:
+            split = _parse_split(split, prefix, filename)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+        # Só é possível cortar em fim de linha sobre o conteúdo decodificado
+        decode_content = True
+
+    if index:
+        if destinations or dedup_mode or delta_sync or split:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({
+                    'error': 'Parâmetro "index" não é suportado junto com "destinations", "dedup", '
+                             '"delta_sync" ou "split"'
+                })
+            }
+        try:
+            index = _parse_index(index, s3_key)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+        # Offsets só servem para range GET se referirem aos bytes gravados sem compressão
+        decode_content = True
+
+    if delta_sync and (destinations or dedup_mode):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Parâmetro "delta_sync" não é suportado junto com "destinations" ou "dedup"'})
+        }
 
     logger.info(f"Iniciando download de: {url}")
-    logger.info(f"Destino S3: s3://{bucket}/{s3_key}")
+    if destinations:
+        for dest in destinations:
+            logger.info(f"Destino S3: s3://{dest['bucket']}/{dest['key']}")
+    else:
+        logger.info(f"Destino S3: s3://{bucket}/{s3_key}")
 
     start_time = time.time()
 
+    # Tempo de CPU por fase (None quando o profiling está desligado)
+    cpu_times = {} if profile_enabled else None
+    rss_scope = _start_profiling(cpu_times) if profile_enabled else None
+
     try:
         # Inicializar cliente S3
-        s3_client = boto3.client('s3')
+        s3_client = _get_s3_client()
 
         # Verificar se arquivo já existe no S3
-        try:
-            s3_client.head_object(Bucket=bucket, Key=s3_key)
+        cpu_start = time.process_time()
+        if destinations:
+            # Fan-out: ignorar apenas os destinos que já possuem o arquivo
+            skipped_destinations = [
+                f"s3://{dest['bucket']}/{dest['key']}" for dest in destinations
+                if _object_exists(s3_client, dest['bucket'], dest['key'])
+            ]
+            destinations = [dest for dest in destinations
+                            if f"s3://{dest['bucket']}/{dest['key']}" not in skipped_destinations]
+            if not destinations:
+                logger.info(f"⚠️ Arquivo {filename} já existe em todos os destinos")
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({
+                        'message': f'Arquivo {filename} já existe em todos os destinos',
+                        'status': 'skipped',
+                        'destinations': [{'s3_location': location, 'status': 'skipped'}
+                                         for location in skipped_destinations],
+                        'url': url
+                    })
+                }
+        elif delta_sync and _object_exists(s3_client, bucket, s3_key):
+            logger.info(f"🔁 Arquivo {filename} já existe no S3, verificando delta...")
+            delta_start = time.time()
+            delta = _delta_sync(s3_client, url, bucket, s3_key)
+            if delta:
+                _add_cpu_time(cpu_times, 's3', time.process_time() - cpu_start)
+                total_time = time.time() - start_time
+                appended_mb = delta['appended_bytes'] / (1024 * 1024)
+                if delta['status'] == 'up_to_date':
+                    logger.info(f"✅ Arquivo {filename} já está atualizado no S3")
+                else:
+                    logger.info(f"✅ Delta aplicado: {appended_mb:.2f} MB acrescentados em {total_time:.2f}s")
+
+                stats = {
+                    'url': url,
+                    'filename': filename,
+                    'size_mb': round(appended_mb, 2),
+                    'object_size_mb': round(delta['remote_size'] / (1024 * 1024), 2),
+                    'delta_time_seconds': round(time.time() - delta_start, 2),
+                    'total_time_seconds': round(total_time, 2),
+                    'init': init_stats
+                }
+                if profile_enabled:
+                    stats['profile'] = _build_profile_stats(cpu_times, rss_scope, context)
+
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({
+                        'message': (f'Arquivo {filename} já está atualizado no S3' if delta['status'] == 'up_to_date'
+                                    else f'{appended_mb:.2f} MB acrescentados a {filename}'),
+                        'status': 'skipped' if delta['status'] == 'up_to_date' else 'appended',
+                        'stats': stats,
+                        'delta': delta,
+                        's3_location': f's3://{bucket}/{s3_key}'
+                    })
+                }
+            # Delta não aplicável: baixar o arquivo completo e sobrescrever
+            logger.info(f"📥 Delta não aplicável, baixando {filename} por completo")
+        elif split and _object_exists(s3_client, bucket, split['manifest_key']):
+            logger.info(f"⚠️ Arquivo {filename} já foi dividido no S3")
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': f'Arquivo {filename} já foi dividido no S3',
+                    'status': 'skipped',
+                    's3_location': f"s3://{bucket}/{split['manifest_key']}",
+                    'url': url
+                })
+            }
+        elif not delta_sync and not split and _object_exists(s3_client, bucket, s3_key):
             logger.info(f"⚠️ Arquivo {filename} já existe no S3")
             return {
                 'statusCode': 200,
@@ -91,20 +1288,15 @@ def lambda_handler(event, context):
                     'url': url
                 })
             }
-        except ClientError as e:
-            if e.response['Error']['Code'] != '404':
-                raise
-            # Arquivo não existe, pode prosseguir
-
-        # Configurar headers para o download
-        headers = {
-            'User-Agent': 'AWS-Lambda-HTTPS-Downloader/1.0'
-        }
+        _add_cpu_time(cpu_times, 's3', time.process_time() - cpu_start)
 
         # Fazer requisição HEAD para obter informações do arquivo
         logger.info("🔍 Verificando informações do arquivo...")
-        head_response = requests.head(url, headers=headers, timeout=30, allow_redirects=True)
-        head_response.raise_for_status()
+        cpu_start = time.process_time()
+        request_headers = COMPRESSED_HEADERS if accept_compressed else IDENTITY_HEADERS
+        head_response = http.request('HEAD', url, headers=request_headers, timeout=HEAD_TIMEOUT)
+        _check_status(head_response, url)
+        _add_cpu_time(cpu_times, 'http', time.process_time() - cpu_start)
 
         # Obter tamanho do arquivo
         content_length = head_response.headers.get('content-length')
@@ -118,14 +1310,153 @@ def lambda_handler(event, context):
         # Fazer download com streaming
         logger.info("📥 Iniciando download...")
         download_start = time.time()
+        cpu_start = time.process_time()
 
-        with requests.get(url, headers=headers, stream=True, timeout=60) as response:
-            response.raise_for_status()
+        with http.request('GET', url, headers=request_headers, timeout=GET_TIMEOUT,
+                          preload_content=False) as response:
+            _check_status(response, url)
 
             # Verificar se o servidor suporta range requests
             accepts_ranges = response.headers.get('accept-ranges') == 'bytes'
             logger.info(f"🔄 Suporte a range requests: {accepts_ranges}")
 
+            # Passthrough: sem decode, os bytes gravados são exatamente os recebidos
+            # (batem com o content-length) e o Content-Encoding da origem vai para o objeto
+            content_type = response.headers.get('content-type', 'application/octet-stream')
+            content_encoding = response.headers.get('content-encoding')
+            content_args = {'ContentType': content_type}
+            if content_encoding and not decode_content:
+                content_args['ContentEncoding'] = content_encoding
+            if content_encoding:
+                logger.info(f"🗜️ Content-Encoding: {content_encoding} "
+                            f"({'decodificado' if decode_content else 'mantido no objeto'})")
+
+            if destinations:
+                # Um único download enviado em paralelo para todos os destinos
+                logger.info(f"🔀 Enviando para {len(destinations)} destino(s) em paralelo")
+                metadata = {
+                    'source-url': url,
+                    'download-date': str(int(time.time())),
+                    'original-filename': filename
+                }
+                if file_size and not (content_encoding and decode_content):
+                    metadata['file-size'] = str(file_size)
+
+                final_size, dest_results = _stream_to_destinations(
+                    s3_client,
+                    response.stream(64 * 1024, decode_content=decode_content),
+                    destinations,
+                    metadata,
+                    content_args,
+                    file_size
+                )
+                # Download e uploads ocorrem em paralelo; o tempo de CPU fica na fase s3
+                _add_cpu_time(cpu_times, 's3', time.process_time() - cpu_start)
+                total_time = time.time() - start_time
+
+                dest_results += [{'s3_location': location, 'status': 'skipped'}
+                                 for location in skipped_destinations]
+                completed = len([r for r in dest_results if r['status'] == 'completed'])
+                failed = len([r for r in dest_results if r['status'] == 'failed'])
+                logger.info(f"🎉 Fan-out concluído: {completed} destino(s) ok, {failed} com falha, "
+                            f"{final_size / (1024 * 1024):.2f} MB em {total_time:.2f}s")
+
+                stats = {
+                    'url': url,
+                    'filename': filename,
+                    'size_mb': round(final_size / (1024 * 1024), 2),
+                    'total_time_seconds': round(total_time, 2),
+                    'average_speed_mbps': round((final_size / (1024 * 1024)) / total_time, 2),
+                    'content_type': content_type,
+                    'content_encoding': content_args.get('ContentEncoding'),
+                    'init': init_stats
+                }
+                if profile_enabled:
+                    stats['profile'] = _build_profile_stats(cpu_times, rss_scope, context)
+
+                if failed == 0:
+                    status = 'completed'
+                elif completed > 0:
+                    status = 'partial'
+                else:
+                    status = 'failed'
+
+                return {
+                    'statusCode': 500 if status == 'failed' else 200,
+                    'body': json.dumps({
+                        'message': f'Arquivo {filename} enviado para {completed} de {len(dest_results)} destino(s)',
+                        'status': status,
+                        'stats': stats,
+                        'destinations': dest_results
+                    })
+                }
+
+            if split:
+                # Divisão em partes alinhadas a registros + manifest
+                logger.info(f"✂️ Dividindo em partes de ~{split['target_size'] / (1024 * 1024):.0f} MB "
+                            f"em s3://{bucket}/{split['prefix']}")
+                metadata = {
+                    'source-url': url,
+                    'download-date': str(int(time.time())),
+                    'original-filename': filename
+                }
+
+                final_size, parts = _split_to_objects(
+                    s3_client,
+                    response.stream(64 * 1024, decode_content=True),
+                    bucket,
+                    split,
+                    metadata,
+                    content_type
+                )
+                # Download e uploads ocorrem em paralelo; o tempo de CPU fica na fase s3
+                _add_cpu_time(cpu_times, 's3', time.process_time() - cpu_start)
+
+                # O manifest é gravado por último e indica que a divisão está completa
+                manifest = {
+                    'source-url': url,
+                    'source-size': final_size,
+                    'created-at': int(time.time()),
+                    'target-size': split['target_size'],
+                    'header': split['header'],
+                    'repeat-header': split['repeat_header'],
+                    'parts': parts
+                }
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=split['manifest_key'],
+                    Body=json.dumps(manifest, indent=2).encode('utf-8'),
+                    ServerSideEncryption='AES256',
+                    ContentType='application/json'
+                )
+                total_time = time.time() - start_time
+                logger.info(f"🎉 {len(parts)} parte(s) gravadas, {final_size / (1024 * 1024):.2f} MB "
+                            f"em {total_time:.2f}s")
+
+                stats = {
+                    'url': url,
+                    'filename': filename,
+                    'size_mb': round(final_size / (1024 * 1024), 2),
+                    'total_time_seconds': round(total_time, 2),
+                    'average_speed_mbps': round((final_size / (1024 * 1024)) / total_time, 2),
+                    'content_type': content_type,
+                    'parts': len(parts),
+                    'init': init_stats
+                }
+                if profile_enabled:
+                    stats['profile'] = _build_profile_stats(cpu_times, rss_scope, context)
+
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({
+                        'message': f'Arquivo {filename} dividido em {len(parts)} parte(s)',
+                        'status': 'completed',
+                        'stats': stats,
+                        'manifest': f"s3://{bucket}/{split['manifest_key']}",
+                        's3_location': f"s3://{bucket}/{split['prefix']}"
+                    })
+                }
+
             # Criar buffer em memória
             file_buffer = io.BytesIO()
 
@@ -133,11 +1464,29 @@ def lambda_handler(event, context):
             downloaded_bytes = 0
             chunk_size = 8192  # 8KB chunks
 
-            for chunk in response.iter_content(chunk_size=chunk_size):
+            # Hash do conteúdo calculado durante o streaming (apenas com dedup)
+            hasher = hashlib.sha256() if dedup_mode else None
+            hash_cpu = 0.0
+
+            # Índice de registros montado durante o streaming (apenas com index)
+            indexer = _RowIndexer(index) if index else None
+            index_cpu = 0.0
+
+            for chunk in response.stream(chunk_size, decode_content=decode_content):
                 if chunk:
                     file_buffer.write(chunk)
                     downloaded_bytes += len(chunk)
 
+                    if hasher:
+                        hash_cpu_start = time.process_time()
+                        hasher.update(chunk)
+                        hash_cpu += time.process_time() - hash_cpu_start
+
+                    if indexer:
+                        index_cpu_start = time.process_time()
+                        indexer.update(chunk)
+                        index_cpu += time.process_time() - index_cpu_start
+
                     # Log de progresso a cada 10MB
                     if downloaded_bytes % (10 * 1024 * 1024) == 0:
                         mb_downloaded = downloaded_bytes / (1024 * 1024)
@@ -150,13 +1499,23 @@ def lambda_handler(event, context):
             # Finalizar download
             final_size = file_buffer.tell()
             file_buffer.seek(0)
+            index_data = None
+            if indexer:
+                index_cpu_start = time.process_time()
+                index_data = indexer.finish()
+                index_cpu += time.process_time() - index_cpu_start
+            _add_cpu_time(cpu_times, 'http', time.process_time() - cpu_start - hash_cpu - index_cpu)
+            _add_cpu_time(cpu_times, 'processing', hash_cpu + index_cpu)
 
             download_time = time.time() - download_start
             logger.info(f"✅ Download concluído: {final_size / (1024 * 1024):.2f} MB em {download_time:.2f}s")
 
+            content_sha256 = hasher.hexdigest() if hasher else None
+
             # Upload para S3
             logger.info("☁️ Iniciando upload para S3...")
             upload_start = time.time()
+            cpu_start = time.process_time()
 
             # Preparar metadados
             metadata = {
@@ -166,8 +1525,45 @@ def lambda_handler(event, context):
                 'file-size': str(final_size)
             }
 
-            # Adicionar Content-Type se disponível
-            content_type = response.headers.get('content-type', 'application/octet-stream')
+            if content_sha256:
+                metadata['content-sha256'] = content_sha256
+
+                # Conteúdo já armazenado com outro nome: não fazer upload novamente
+                existing = _lookup_content_index(s3_client, bucket, dedup_index_prefix, content_sha256)
+                if existing:
+                    canonical_location = f"s3://{existing['bucket']}/{existing['key']}"
+                    logger.info(f"♻️ Conteúdo idêntico já existe em {canonical_location} (modo: {dedup_mode})")
+                    _write_dedup_object(s3_client, dedup_mode, existing, bucket, s3_key, metadata, content_args)
+                    _add_cpu_time(cpu_times, 's3', time.process_time() - cpu_start)
+                    total_time = time.time() - start_time
+
+                    stats = {
+                        'url': url,
+                        'filename': filename,
+                        'size_mb': round(final_size / (1024 * 1024), 2),
+                        'download_time_seconds': round(download_time, 2),
+                        'total_time_seconds': round(total_time, 2),
+                        'content_type': content_type,
+                        'content_encoding': content_args.get('ContentEncoding'),
+                        'init': init_stats
+                    }
+                    if profile_enabled:
+                        stats['profile'] = _build_profile_stats(cpu_times, rss_scope, context)
+
+                    return {
+                        'statusCode': 200,
+                        'body': json.dumps({
+                            'message': f'Conteúdo de {filename} já existe em {canonical_location}',
+                            'status': 'deduplicated',
+                            'stats': stats,
+                            'dedup': {
+                                'mode': dedup_mode,
+                                'content_sha256': content_sha256,
+                                'canonical_location': canonical_location
+                            },
+                            's3_location': canonical_location if dedup_mode == 'skip' else f's3://{bucket}/{s3_key}'
+                        })
+                    }
 
             # Upload com configuração otimizada
             if final_size > 100 * 1024 * 1024:  # > 100MB
@@ -185,7 +1581,7 @@ def lambda_handler(event, context):
                     ExtraArgs={
                         'ServerSideEncryption': 'AES256',
                         'Metadata': metadata,
-                        'ContentType': content_type
+                        **content_args
                     }
                 )
             else:
@@ -197,11 +1593,35 @@ def lambda_handler(event, context):
                     ExtraArgs={
                         'ServerSideEncryption': 'AES256',
                         'Metadata': metadata,
-                        'ContentType': content_type
+                        **content_args
                     }
                 )
 
+            # Índice gravado depois do objeto: se existir, corresponde ao conteúdo atual
+            if index_data is not None:
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=index['key'],
+                    Body=index_data,
+                    ServerSideEncryption='AES256',
+                    Metadata={'source-url': url, 'indexed-key': s3_key},
+                    ContentType='application/octet-stream'
+                )
+                logger.info(f"🗂️ Índice gravado: s3://{bucket}/{index['key']} ({indexer.records} registros, "
+                            f"{len(indexer.blocks)} bloco(s), {len(index_data)} bytes)")
+
+            # Registrar o novo conteúdo no índice
+            if content_sha256:
+                _register_content(s3_client, bucket, dedup_index_prefix, content_sha256, {
+                    'bucket': bucket,
+                    'key': s3_key,
+                    'size': final_size,
+                    'source-url': url,
+                    'registered-at': int(time.time())
+                })
+
             upload_time = time.time() - upload_start
+            _add_cpu_time(cpu_times, 's3', time.process_time() - cpu_start)
             total_time = time.time() - start_time
 
             logger.info("🎉 Upload completo!")
@@ -215,34 +1635,58 @@ def lambda_handler(event, context):
             logger.info(f"   - Velocidade média: {(final_size / (1024 * 1024)) / total_time:.2f} MB/s")
             logger.info(f"   - Localização S3: s3://{bucket}/{s3_key}")
 
+            stats = {
+                'url': url,
+                'filename': filename,
+                'size_mb': round(final_size / (1024 * 1024), 2),
+                'download_time_seconds': round(download_time, 2),
+                'upload_time_seconds': round(upload_time, 2),
+                'total_time_seconds': round(total_time, 2),
+                'average_speed_mbps': round((final_size / (1024 * 1024)) / total_time, 2),
+                'content_type': content_type,
+                'content_encoding': content_args.get('ContentEncoding'),
+                'init': init_stats
+            }
+            if content_sha256:
+                stats['content_sha256'] = content_sha256
+            if index_data is not None:
+                stats['index'] = {
+                    's3_location': f"s3://{bucket}/{index['key']}",
+                    'records': indexer.records,
+                    'lines': indexer.lines,
+                    'blocks': len(indexer.blocks),
+                    'size_bytes': len(index_data)
+                }
+
+            if profile_enabled:
+                stats['profile'] = _build_profile_stats(cpu_times, rss_scope, context)
+                logger.info(f"   - Pico de memória: {stats['profile']['peak_rss_mb']:.1f} MB "
+                            f"(limite: {stats['profile']['memory_limit_mb']} MB)")
+                logger.info(f"   - CPU por fase: {stats['profile']['cpu_seconds']}")
+
             return {
                 'statusCode': 200,
                 'body': json.dumps({
                     'message': f'Arquivo {filename} transferido com sucesso',
                     'status': 'completed',
-                    'stats': {
-                        'url': url,
-                        'filename': filename,
-                        'size_mb': round(final_size / (1024 * 1024), 2),
-                        'download_time_seconds': round(download_time, 2),
-                        'upload_time_seconds': round(upload_time, 2),
-                        'total_time_seconds': round(total_time, 2),
-                        'average_speed_mbps': round((final_size / (1024 * 1024)) / total_time, 2),
-                        'content_type': content_type
-                    },
+                    'stats': stats,
                     's3_location': f's3://{bucket}/{s3_key}'
                 })
             }
 
-    except requests.exceptions.RequestException as e:
+    except (urllib3.exceptions.HTTPError, HTTPStatusError) as e:
         error_msg = f"Erro no download da URL {url}: {str(e)}"
         logger.error(error_msg)
+        # Causa original após as tentativas (ex.: ReadTimeoutError dentro de MaxRetryError)
+        cause = getattr(e, 'reason', None) or e
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'message': 'Falha no download',
                 'url': url,
                 'error': error_msg,
+                'error_type': type(cause).__name__,
+                'http_status': getattr(e, 'status', None),
                 'status': 'failed'
             })
         }
@@ -274,3 +1718,13 @@ def lambda_handler(event, context):
                 'status': 'failed'
             })
         }
+
+    finally:
+        # Não deixar o tracemalloc ativo entre invocações do mesmo container
+        if profile_enabled:
+            _stop_profiling()
+
+
+# Duração do carregamento do módulo (imports e clientes), reportada no cold start
+_INIT_DURATION = time.perf_counter() - _MODULE_LOAD_START
+_COLD_START = True
@@ -0,0 +1,200 @@
+import io
+import json
+import time
+
+import bulk_run_configurable
+from bulk_run_configurable import (MetadataCache, lookup_content_index, plan_with_cache,
+                                   update_cache_from_result)
+
+
+class NotFound(Exception):
+    response = {'Error': {'Code': 'NoSuchKey'}}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put(self, bucket, key, body=b'', metadata=None):
+        self.objects[(bucket, key)] = (body, metadata or {})
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise NotFound(Key)
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)][0])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise NotFound(Key)
+        return {'Metadata': self.objects[(Bucket, Key)][1]}
+
+
+def register(s3, content_sha256, key):
+    s3.put('bk', key, b'dados', {'content-sha256': content_sha256})
+    entry = {'bucket': 'bk', 'key': key}
+    s3.put('bk', f"{bulk_run_configurable.DEFAULT_DEDUP_INDEX_PREFIX}sha256/{content_sha256}.json",
+           json.dumps(entry).encode())
+    return entry
+
+
+def test_lookup_content_index_resolves_preloaded_and_new_hashes():
+    s3 = FakeS3()
+    entry = register(s3, 'aa', 'dados/a.csv')
+    index = {'aa': f"{bulk_run_configurable.DEFAULT_DEDUP_INDEX_PREFIX}sha256/aa.json"}
+
+    assert lookup_content_index(s3, 'bk', index, 'aa') == entry
+    # Registrado depois do pré-carregamento: lido direto do índice
+    assert lookup_content_index(s3, 'bk', index, 'bb') is None
+    entry_b = register(s3, 'bb', 'dados/b.csv')
+    assert lookup_content_index(s3, 'bk', index, 'bb') == entry_b
+
+
+def test_lookup_content_index_ignores_changed_canonical_object():
+    s3 = FakeS3()
+    register(s3, 'aa', 'dados/a.csv')
+    s3.put('bk', 'dados/a.csv', b'outro conteudo', {})
+
+    assert lookup_content_index(s3, 'bk', {}, 'aa') is None
+
+
+class FakeHedgeS3:
+    def __init__(self, fail_delete=False):
+        self.fail_delete = fail_delete
+        self.copies = []
+        self.deleted = []
+
+    def head_object(self, Bucket, Key):
+        return {'Metadata': {'file-size': '1'}, 'ContentType': 'text/csv', 'ContentEncoding': 'gzip'}
+
+    def copy(self, source, bucket, key, ExtraArgs=None):
+        self.copies.append((source['Key'], key, ExtraArgs))
+
+    def delete_object(self, Bucket, Key):
+        if self.fail_delete:
+            raise RuntimeError('AccessDenied')
+        self.deleted.append(Key)
+
+
+class FakeLambdaClient:
+    class meta:
+        region_name = 'us-east-1'
+
+
+def run_hedged_batch(monkeypatch, tmp_path, s3, slow_original, slow_hedge):
+    """Lote de 10 arquivos em que f7.csv é lento; slow_* = (segundos, status) da tentativa"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bulk_run_configurable.boto3, 'client',
+                        lambda name, **kwargs: s3 if name == 's3' else FakeLambdaClient())
+    monkeypatch.setattr(bulk_run_configurable, 'check_aws_credentials', lambda: True)
+    monkeypatch.setattr(bulk_run_configurable, 'test_lambda_function_simple', lambda client, name: True)
+    monkeypatch.setattr(bulk_run_configurable, 'probe_content_length', lambda url, timeout=10: 1024 * 1024)
+    monkeypatch.setattr(bulk_run_configurable, 'HEDGE_CHECK_INTERVAL', 0.02)
+
+    def fake_invoke(client, function_name, file_config, index, total):
+        seconds, status = 0.05, 'success'
+        if file_config['filename'] == 'f7.csv':
+            seconds, status = slow_hedge if '_hedge/' in file_config['prefix'] else slow_original
+        time.sleep(seconds)
+        if status != 'success':
+            return {'filename': file_config['filename'], 'status': status, 'execution_time': seconds,
+                    'result': {'statusCode': 500, 'body': json.dumps({'message': 'Falha no download'})}}
+        return {'filename': file_config['filename'], 'status': 'success', 'execution_time': seconds,
+                'result': {'stats': {'size_mb': 1}, 's3_location': f"s3://bk/{file_config['prefix']}x"}}
+
+    monkeypatch.setattr(bulk_run_configurable, 'invoke_lambda_for_file', fake_invoke)
+    bulk_run_configurable.process_files_with_config({
+        'function_name': 'lambdownload', 'max_concurrent': 4, 'bucket': 'bk', 'prefix': 'dados',
+        'base_url': 'http://origem/', 'files': [f'f{i}.csv' for i in range(10)],
+        'hedge': {'min_elapsed': 0.2, 'multiplier': 2}
+    })
+    with open(tmp_path / 'batch_results.json', encoding='utf-8') as f:
+        data = json.load(f)
+    return {r['filename']: r for r in data['results']}, data['summary']
+
+
+def test_hedge_win_promotes_copy_with_object_attributes(monkeypatch, tmp_path):
+    s3 = FakeHedgeS3()
+    results, summary = run_hedged_batch(monkeypatch, tmp_path, s3, (1.5, 'success'), (0.05, 'success'))
+
+    assert len(results) == 10
+    assert results['f7.csv']['hedge'] == 'won'
+    assert summary['hedge'] == {'launched': 1, 'won': 1}
+    [(source, key, extra_args)] = s3.copies
+    assert source.startswith('dados/_hedge/') and key == 'dados/f7.csv'
+    assert extra_args['Metadata'] == {'file-size': '1'}
+    assert extra_args['ContentEncoding'] == 'gzip'
+    assert s3.deleted == [source]
+
+
+def test_hedge_cleanup_failure_keeps_winning_result(monkeypatch, tmp_path):
+    s3 = FakeHedgeS3(fail_delete=True)
+    results, summary = run_hedged_batch(monkeypatch, tmp_path, s3, (1.5, 'success'), (0.05, 'success'))
+
+    assert len(results) == 10
+    assert summary['stats']['completed'] == 10
+    assert summary['stats']['in_flight'] == 0
+    assert results['f7.csv']['status'] == 'success'
+    assert results['f7.csv']['hedge'] == 'won'
+
+
+def test_original_failure_is_deferred_until_hedge_fails(monkeypatch, tmp_path):
+    s3 = FakeHedgeS3()
+    results, summary = run_hedged_batch(monkeypatch, tmp_path, s3, (0.5, 'error'), (1.0, 'error'))
+
+    assert len(results) == 10
+    assert results['f7.csv']['status'] == 'error'
+    assert 'hedge' not in results['f7.csv']
+    assert summary['hedge'] == {'launched': 1, 'won': 0}
+    assert s3.copies == []
+
+
+def test_losing_hedge_never_copies_over_original(monkeypatch, tmp_path):
+    s3 = FakeHedgeS3()
+    results, summary = run_hedged_batch(monkeypatch, tmp_path, s3, (0.5, 'success'), (1.0, 'success'))
+
+    assert len(results) == 10
+    assert results['f7.csv']['status'] == 'success'
+    assert 'hedge' not in results['f7.csv']
+    # A tentativa perdedora termina depois do relatório: aguardar e conferir que não copiou
+    time.sleep(1.0)
+    assert s3.copies == []
+
+
+def cached_plan(cache, file_config):
+    cache.put(file_config['url'], {'status': 200, 'size': 10, 'etag': None, 'last_modified': None})
+    return plan_with_cache(cache, [file_config])
+
+
+def test_cache_records_permanent_failure_from_error_body(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'))
+    body = json.dumps({'message': 'Falha no download: HTTP 404', 'error_type': 'HTTPStatusError', 'http_status': 404})
+    update_cache_from_result(cache, 'http://origem/a.csv',
+                             {'status': 'error', 'result': {'statusCode': 500, 'body': body}})
+    # Mensagem parecida, mas sem http_status permanente no corpo
+    body = json.dumps({'message': 'Falha no download: HTTP 503 (tentativa 404)', 'http_status': 503})
+    update_cache_from_result(cache, 'http://origem/b.csv',
+                             {'status': 'error', 'result': {'statusCode': 500, 'body': body}})
+    update_cache_from_result(cache, 'http://origem/c.csv',
+                             {'status': 'error', 'function_error': True, 'result': {'errorMessage': ' 404 '}})
+
+    entries = cache.get_many(['http://origem/a.csv', 'http://origem/b.csv', 'http://origem/c.csv'])
+    assert entries['http://origem/a.csv']['status'] == 404
+    assert set(entries) == {'http://origem/a.csv'}
+
+
+def test_deduplicated_skip_is_resolved_by_cache_at_canonical_location(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'))
+    file_config = {'url': 'http://origem/b.csv', 'bucket': 'bk', 'prefix': 'dados', 'filename': 'b.csv'}
+    assert cached_plan(cache, file_config)[1] == []
+
+    update_cache_from_result(cache, file_config['url'], {
+        'status': 'deduplicated',
+        'result': {'status': 'deduplicated', 's3_location': 's3://bk/dados/a.csv'}
+    }, 's3://bk/dados/b.csv')
+    to_process, resolved = cached_plan(cache, file_config)
+
+    assert to_process == []
+    assert resolved[0]['status'] == 'skipped'
+    assert resolved[0]['result']['s3_location'] == 's3://bk/dados/a.csv'
+    # Outro destino para a mesma URL não é resolvido pelo registro anterior
+    assert cached_plan(cache, dict(file_config, prefix='outro'))[0] != []
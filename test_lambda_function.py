@@ -0,0 +1,115 @@
+import csv
+import io
+import threading
+
+import pytest
+
+from lambda_function import _parse_index, _parse_split, _RowIndexer, _split_to_objects, read_index
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self.lock:
+            self.objects[Key] = Body
+
+
+def build_index(data, chunk_size=3, **options):
+    indexer = _RowIndexer(_parse_index(options or True, 'dados/arquivo.csv'))
+    for start in range(0, len(data), chunk_size):
+        indexer.update(data[start:start + chunk_size])
+    return indexer.finish()
+
+
+def test_round_trip_numeric_key():
+    data = b'id,valor\n' + b''.join(f'{i},{i * 10}\n'.encode() for i in range(25))
+    index = read_index(build_index(data, every_n_records=10, key_column='valor', key_type='number'))
+
+    assert index['records'] == 25
+    assert index['lines'] == 26
+    assert index['size'] == len(data)
+    assert index['data_offset'] == len(b'id,valor\n')
+    assert index['key_column'] == 'valor'
+    assert index['key_type'] == 'number'
+    assert [block['first_record'] for block in index['blocks']] == [0, 10, 20]
+    for block in index['blocks']:
+        assert data[block['offset']:].startswith(f"{block['first_record']},".encode())
+    assert [(block['min'], block['max']) for block in index['blocks']] == [(0, 90), (100, 190), (200, 240)]
+
+
+def test_round_trip_string_key_without_header():
+    data = b'b;x\r\na;y\r\nc;z'
+    index = read_index(build_index(data, every_n_records=2, key_column=0, header=False, delimiter=';'))
+
+    assert index['records'] == 3
+    assert index['data_offset'] == 0
+    assert index['key_type'] == 'string'
+    assert [(block['offset'], block['min'], block['max']) for block in index['blocks']] == [
+        (0, b'a', b'b'), (10, b'c', b'c')
+    ]
+
+
+def test_quoted_newlines_do_not_shift_records():
+    data = b'a,b\n1,5\n2,3\n"x\ny",9\n4,1\n5,2'
+    index = read_index(build_index(data, every_n_records=2, key_column='a'))
+
+    assert index['records'] == 5
+    assert index['lines'] == 7
+    assert [block['first_record'] for block in index['blocks']] == [0, 2, 4]
+    assert [data[block['offset']:block['offset'] + 2] for block in index['blocks']] == [b'1,', b'"x', b'5,']
+    assert index['blocks'][1]['min'] == b'4'
+    assert index['blocks'][1]['max'] == b'x\ny'
+
+
+def test_without_quotechar_every_line_is_a_record():
+    data = b'a\n"x\ny"\n'
+    index = read_index(build_index(data, every_n_records=1, quotechar=None))
+
+    assert index['records'] == 2
+    assert index['key_column'] is None
+    assert [block['offset'] for block in index['blocks']] == [2, 5]
+
+
+def test_read_index_rejects_other_objects():
+    with pytest.raises(ValueError):
+        read_index(b'id,valor\n')
+
+
+def split_parts(data, target_size, chunk_size=7, **options):
+    s3 = FakeS3()
+    split = _parse_split(options or True, 'dados', 'arquivo.csv')
+    split['target_size'] = target_size
+    chunks = [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+    total, parts = _split_to_objects(s3, chunks, 'bk', split, {}, 'text/csv')
+    assert total == len(data)
+    return [(part['records'], s3.objects[part['key']]) for part in parts]
+
+
+def test_split_keeps_quoted_newlines_inside_parts():
+    data = b'id,texto\n' + b''.join(f'{i},"linha {i}\ncontinua"\n'.encode() for i in range(200))
+    parts = split_parts(data, target_size=300)
+
+    assert len(parts) > 5
+    assert b''.join(body for _, body in parts) == data
+    assert sum(records for records, _ in parts) == 200
+    for number, (records, body) in enumerate(parts):
+        rows = list(csv.reader(io.StringIO(body.decode(), newline='')))
+        assert records == len(rows) - (1 if number == 0 else 0)
+        assert rows[-1][1].endswith('continua')
+
+
+def test_split_repeat_header_counts_only_data_records():
+    data = b'id,v\n1,aaaaaaaaaaaaaa\n2,bbbbbbbbbbbbbbbbb\n3,c'
+    parts = split_parts(data, target_size=25, repeat_header=True)
+
+    assert parts == [(1, b'id,v\n1,aaaaaaaaaaaaaa\n'), (2, b'id,v\n2,bbbbbbbbbbbbbbbbb\n3,c')]
+
+
+def test_split_without_header_or_quotechar_is_line_based():
+    data = b'"a\nb"\nc\n'
+    assert [records for records, _ in split_parts(data, target_size=2, header=False, quotechar=None)] == [1, 1, 1]
+    assert [records for records, _ in split_parts(data, target_size=2, header=False)] == [1, 1]
+    assert split_parts(b'id,v', target_size=2) == [(0, b'id,v')]